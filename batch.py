@@ -0,0 +1,135 @@
+'''
+batch.py
+--------
+Solves many problem files with one pool of worker processes, instead
+of starting planner.py once per problem.
+
+usage: python batch.py <directory or glob>... [options]
+
+Each problem's plan is written in the same format as planner.py, to
+the problem's file name with the extension ".out" (in --outdir if
+given), and one JSON line summarising the run is written per problem,
+in the order the problems finish:
+
+{"problem": "test1.txt", "output": "test1.out", "status": "solved",
+ "seconds": 0.05, "iterations": 14, "planLength": 6, "flaws": 0}
+
+status is a SearchResult status (see budget.py), "unreadable" if the
+problem file could not be read, or "error" if the search raised an
+exception (described by "error"). --time-limit, --node-limit and
+--memory-limit apply to each problem separately.
+'''
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+from read import *
+from plansearch import *
+from options import *
+
+## The search modes a pool worker can run (hda starts processes of its own)
+BatchModes = tuple( [ mode for mode in SearchModes if mode != "hda" ] )
+
+'''
+Returns the problem files named by a list of directories and globs:
+every .txt file in a directory, and every file a glob matches
+'''
+def find_problems( patterns ):
+    problems = []
+    for pattern in patterns:
+        if ( os.path.isdir( pattern ) ):
+            problems.extend( sorted( glob.glob( os.path.join( pattern , "*.txt" ) ) ) )
+        else:
+            problems.extend( sorted( glob.glob( pattern ) ) )
+    return problems
+
+## The file a problem's plan is written to
+def output_file( problem , outdir ):
+    name = os.path.splitext( problem )[ 0 ] + ".out"
+    if ( outdir is not None ):
+        name = os.path.join( outdir , os.path.basename( name ) )
+    return name
+
+## Pool worker initialiser: the search's progress messages would
+## interleave across workers, so they are discarded
+def quiet_worker():
+    sys.stdout = open( os.devnull , "w" )
+
+'''
+Solves one problem and returns its summary. "task" is a tuple
+( problem file , output file , search_plan keyword arguments ).
+'''
+def solve_problem( task ):
+    ( problem , outputfile , options ) = task
+    summary = { "problem" : problem , "output" : None , "status" : None , "seconds" : None ,
+                "iterations" : None , "planLength" : None , "flaws" : None }
+    started = time.time()
+    try:
+        readInputStatus = readfile( problem )
+        if ( not readInputStatus[ 0 ] ):
+            summary[ "status" ] = "unreadable"
+            return summary
+        ( initial , tracker ) = readInputStatus[ 1 : ]
+
+        result = search_plan( initial , tracker , **options )
+        summary[ "status" ] = result.status
+        summary[ "iterations" ] = result.stats[ "iterations" ]
+        #an exhausted search has no plan worth writing
+        if ( result.plan is not None and result.status != EXHAUSTED ):
+            #the start and finish steps are not part of the plan's length
+            summary[ "planLength" ] = len( result.plan.steps ) - 2
+            summary[ "flaws" ] = len( result.flaws )
+            writePlan( result.plan , outputfile )
+            summary[ "output" ] = outputfile
+    except Exception , e:
+        summary[ "status" ] = "error"
+        summary[ "error" ] = "".join( traceback.format_exception_only( type( e ) , e ) ).strip()
+    finally:
+        summary[ "seconds" ] = round( time.time() - started , 3 )
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser( description = "Find partially ordered plans for many problem files" )
+    parser.add_argument( "problems" , nargs = "+" ,
+                         help = "problem files, directories of .txt problem files, or globs" )
+    parser.add_argument( "--outdir" , help = "directory to write the plans to (default: beside each problem)" )
+    parser.add_argument( "--summary" , help = "file to write the JSON lines summary to (default: standard output)" )
+    parser.add_argument( "--jobs" , type = int , default = None ,
+                         help = "number of worker processes (default: one per core)" )
+    parser.add_argument( "--tasks-per-worker" , type = int , default = 50 ,
+                         help = "problems a worker solves before it is replaced by a fresh one (default %(default)s)" )
+    add_search_arguments( parser , BatchModes )
+    args = parser.parse_args()
+
+    problems = find_problems( args.problems )
+    if ( not problems ):
+        parser.error( "no problem files found" )
+    if ( args.outdir is not None and not os.path.isdir( args.outdir ) ):
+        os.makedirs( args.outdir )
+
+    options = search_options( args )
+    tasks = [ ( problem , output_file( problem , args.outdir ) , options ) for problem in problems ]
+    summary = open( args.summary , "w" ) if args.summary else sys.stdout
+
+    pool = multiprocessing.Pool( args.jobs , quiet_worker , maxtasksperchild = args.tasks_per_worker )
+    try:
+        for record in pool.imap_unordered( solve_problem , tasks ):
+            summary.write( json.dumps( record , sort_keys = True ) + "\n" )
+            summary.flush()
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if ( summary is not sys.stdout ):
+            summary.close()
+
+if __name__ == "__main__":
+    main()
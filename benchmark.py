@@ -0,0 +1,158 @@
+'''
+benchmark.py
+------------
+Microbenchmarks for the planner's inner loops.
+
+usage: python benchmark.py <problem file> [unify|memory|frontier|all] [options]
+
+unify - times the original name-based unifier (Predicate.unify)
+        against the integer unifier the search uses (unify_ids), on
+        every pair of same-typed predicates drawn from the problem's
+        initial facts and goals and from new steps of every schema
+memory - runs a best first search for a number of expansions and
+         reports the memory held by the plans left on its frontier,
+         in bytes per plan (structure shared between plans is only
+         counted once)
+frontier - runs A* once with every secondary frontier key (see
+           FrontierKeys) and reports whether each run found a complete
+           plan, and after how many iterations
+'''
+
+import argparse
+import gc
+import sys
+import timeit
+import types
+
+from read import *
+from structures import *
+from plansearch import *
+from frontier import FrontierKeys
+
+'''
+Returns the ( x , y ) predicate pairs of the same type that the
+search could try to unify on the given problem: add and delete list
+entries of the start step and of new steps, against goals and the
+preconditions of new steps
+'''
+def unification_pairs( plan , tracker ):
+    #every new step gets variables of its own
+    fresh = []
+    nextVar = plan.nextVar
+    for schemaType in sorted( SchemaArity ) * 2:
+        fresh.append( fresh_action( schemaType , nextVar ) )
+        nextVar += SchemaArity[ schemaType ]
+    
+    steps = [ plan.steps[ 0 ] ] + fresh[ : len( SchemaArity ) ]
+    conditions = [ cond[ 0 ] for cond in plan.open_conditions ]
+    for action in fresh[ len( SchemaArity ) : ]:
+        conditions.extend( action.getPrereqs() )
+
+    pairs = []
+    for step in steps:
+        for x in step.addList + step.deleteList:
+            for y in conditions:
+                if ( x.type_t == y.type_t ):
+                    pairs.append( ( x , y ) )
+    return pairs
+
+## Prints how long "repeat" unifications of every pair take with each unifier
+def benchmark_unify( plan , tracker , repeat ):
+    pairs = unification_pairs( plan , tracker )
+    ground = tracker.groundEnd
+
+    #both unifiers must agree on which pairs unify
+    for ( x , y ) in pairs:
+        if ( ( Predicate.unify( x.args , y.args , [] , tracker ) is None ) !=
+             ( unify_ids( x.args , y.args , ground ) is None ) ):
+            print "Unifiers disagree on " + str( x ) + " and " + str( y )
+
+    def run_original():
+        for ( x , y ) in pairs:
+            Predicate.unify( x.args , y.args , [] , tracker )
+
+    def run_integer():
+        for ( x , y ) in pairs:
+            unify_ids( x.args , y.args , ground )
+
+    original = min( timeit.repeat( run_original , number = repeat , repeat = 3 ) )
+    integer = min( timeit.repeat( run_integer , number = repeat , repeat = 3 ) )
+    calls = float( len( pairs ) * repeat )
+    print "unify: " + str( len( pairs ) ) + " predicate pairs x " + str( repeat )
+    print "  Predicate.unify  %8.3f us per call" % ( original / calls * 1e6 )
+    print "  unify_ids        %8.3f us per call" % ( integer / calls * 1e6 )
+    print "  speedup          %8.1fx" % ( original / integer )
+
+## Objects that belong to the program rather than to any plan
+SharedTypes = ( type , types.ClassType , types.ModuleType , types.FunctionType ,
+                types.BuiltinFunctionType , types.MethodType )
+
+'''
+Returns the number of bytes taken by the objects reachable from
+"roots", counting every object once
+'''
+def deep_size( roots ):
+    seen = set()
+    pending = list( roots )
+    total = 0
+    while pending:
+        obj = pending.pop()
+        if ( id( obj ) in seen or isinstance( obj , SharedTypes ) or obj is Predicate.tracker ):
+            continue
+        seen.add( id( obj ) )
+        total += sys.getsizeof( obj )
+        pending.extend( gc.get_referents( obj ) )
+    return total
+
+## Prints the memory held per plan on the frontier after "expansions" expansions
+def benchmark_memory( plan , tracker , expansions ):
+    estimate = cost_function()
+    frontier = Frontier()
+    frontier.put( estimate( plan ) , plan )
+    for i in range( expansions ):
+        if ( frontier.empty() ):
+            break
+        nextPlan = frontier.get()[ 1 ]
+        if ( nextPlan.is_complete() ):
+            break
+        for ( cost , child ) in successors( nextPlan , select_default , tracker , estimate ):
+            frontier.put( cost , child )
+    
+    plans = [ entry[ -1 ] for entry in frontier.heap ]
+    size = deep_size( plans )
+    print "memory: " + str( len( plans ) ) + " frontier plans after " + str( i + 1 ) + " expansions"
+    print "  %8d bytes per plan" % ( size / max( len( plans ) , 1 ) )
+
+## Prints the outcome of an A* search with each frontier key, and with none
+def benchmark_frontier( plan , tracker , expansions ):
+    print "frontier: A* with at most " + str( expansions ) + " expansions"
+    for keys in [ () ] + [ ( key , ) for key in sorted( FrontierKeys ) ]:
+        result = search_plan( plan , tracker , frontierKeys = keys , nodeLimit = expansions )
+        print "  %-8s %-10s %6d iterations" % ( ",".join( keys ) or "none" , result.status ,
+                                                result.stats[ "iterations" ] )
+
+def main():
+    parser = argparse.ArgumentParser( description = "Microbenchmarks for the planner" )
+    parser.add_argument( "inputfile" )
+    parser.add_argument( "benchmark" , nargs = "?" , choices = ( "unify" , "memory" , "frontier" , "all" ) , default = "all" )
+    parser.add_argument( "--repeat" , type = int , default = 200 ,
+                         help = "times the unify benchmark runs over its inputs (default %(default)s)" )
+    parser.add_argument( "--expansions" , type = int , default = 500 ,
+                         help = "plans the memory and frontier benchmarks expand (default %(default)s)" )
+    args = parser.parse_args()
+
+    readInputStatus = readfile( args.inputfile )
+    if ( not readInputStatus[ 0 ] ):
+        print "Could not read file"
+        return
+    ( plan , tracker ) = readInputStatus[ 1 : ]
+
+    if ( args.benchmark in ( "unify" , "all" ) ):
+        benchmark_unify( plan , tracker , args.repeat )
+    if ( args.benchmark in ( "memory" , "all" ) ):
+        benchmark_memory( plan , tracker , args.expansions )
+    if ( args.benchmark in ( "frontier" , "all" ) ):
+        benchmark_frontier( plan , tracker , args.expansions )
+
+if __name__ == "__main__":
+    main()
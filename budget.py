@@ -0,0 +1,89 @@
+'''
+budget.py
+---------
+Contains the limits a plan search runs under ("Budget") and the
+outcome it reports ("SearchResult").
+
+A budget bounds the wall-clock time, the number of plans expanded
+and the memory (peak resident set size) of a search. The search
+checks its budget once per expansion; only the node limit is checked
+every time, while the clock and memory use are read once every
+CHECK_INTERVAL expansions to keep the check cheap.
+'''
+
+import resource
+import time
+
+from flaws import *
+
+## The statuses of a search result
+SOLVED = "solved" ## a complete plan was found
+EXHAUSTED = "exhausted" ## every plan was searched, and none is complete
+TIME_LIMIT = "time_limit" ## the search ran out of time
+NODE_LIMIT = "node_limit" ## the search expanded as many plans as it may
+MEMORY_LIMIT = "memory_limit" ## the process grew past its memory limit
+
+## Expansions between two readings of the clock and of memory use
+CHECK_INTERVAL = 64
+
+## The peak resident set size of this process, in megabytes
+def peak_memory():
+    return resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss / 1024.0
+
+'''
+Budget
+------
+The limits on a search. Each limit is None when unbounded:
+timeLimit - seconds of wall-clock time from when the budget is made
+nodeLimit - plans expanded
+memoryLimit - megabytes of peak resident set size
+'''
+class Budget:
+
+    def __init__( self , timeLimit = None , nodeLimit = None , memoryLimit = None ):
+        self.timeLimit = timeLimit
+        self.nodeLimit = nodeLimit
+        self.memoryLimit = memoryLimit
+        self.started = time.time()
+
+    ## Seconds since the budget was made
+    def elapsed( self ):
+        return time.time() - self.started
+
+    '''
+    Returns the status a search that has expanded "expansions" plans
+    has to stop with (TIME_LIMIT, NODE_LIMIT or MEMORY_LIMIT), or None
+    if it is still within budget
+    '''
+    def exceeded( self , expansions ):
+        if ( self.nodeLimit is not None and expansions >= self.nodeLimit ):
+            return NODE_LIMIT
+        if ( expansions % CHECK_INTERVAL != 0 ):
+            return None
+        if ( self.timeLimit is not None and self.elapsed() >= self.timeLimit ):
+            return TIME_LIMIT
+        if ( self.memoryLimit is not None and peak_memory() >= self.memoryLimit ):
+            return MEMORY_LIMIT
+        return None
+
+'''
+SearchResult
+------------
+The outcome of a search:
+status - one of SOLVED, EXHAUSTED, TIME_LIMIT, NODE_LIMIT, MEMORY_LIMIT
+plan - the complete plan if solved, otherwise the partial plan closest
+       to completion that was found (or None)
+flaws - the flaws left in that plan, as (kind, key) pairs (see flaws.py)
+stats - a dict of statistics: "iterations" (plans expanded), "seconds",
+        "peakMemory" (megabytes), and any the search mode adds
+'''
+class SearchResult:
+
+    def __init__( self , status , plan , stats ):
+        self.status = status
+        self.plan = plan
+        self.flaws = list_flaws( plan ) if plan is not None else []
+        self.stats = stats
+
+    def solved( self ):
+        return self.status == SOLVED
@@ -18,6 +18,7 @@ class Categories:
     CONTAINERS = 4
     INITIAL = 5
     GOAL = 6
+    GROUND = 7 ## the "G" literal under every pile (not a section of the problem file)
 
 
 Name2Category = {"locations" : Categories.LOCATIONS, "robots" : Categories.ROBOTS, "cranes" : Categories.CRANES, "piles" : Categories.PILES, "containers" : Categories.CONTAINERS, "initial" : Categories.INITIAL, "goal" : Categories.GOAL}
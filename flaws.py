@@ -0,0 +1,167 @@
+'''
+flaws.py
+--------
+Contains the flaw selection strategies for the plan search.
+
+A flaw is either a threat to a causal link or an open condition.
+A strategy is a function that takes a plan with at least one flaw
+and returns the flaw to resolve next as a pair (kind, key), where
+kind is THREAT or OPEN, and key is the Threat itself (plan.threats
+is keyed by threat) or the position of the open condition in
+plan.open_conditions.
+'''
+
+from configure import *
+from structures import *
+
+THREAT = 0
+OPEN = 1
+
+## An upper bound on the refinements of any flaw, used as the
+## counting limit before a best flaw has been found
+INFINITE_REFINEMENTS = 1000000
+
+## The number of ways that a new step can add each predicate type,
+## counting every (schema, add list entry) pair of that type
+newStepAchievers = dict( [ ( t , len( Achievers[ t ] ) ) for t in Achievers ] )
+
+## For each predicate type, the types a new step requires of the
+## predicate's arguments, one tuple per (schema, add list entry) pair
+AchieverTypes = dict( [ ( t , [ tuple( [ SchemaTypes[ schemaType ][ s ] for s in Schemas[ schemaType ][ ADDS ][ slot ][ 1 ] ] )
+                                for ( schemaType , slot ) in Achievers[ t ] ] )
+                        for t in Achievers ] )
+
+'''
+Returns if a predicate can only ever be added by the start step
+(adjacent, attached and belong)
+'''
+def is_static( pred ):
+    return newStepAchievers.get( pred.type_t , 0 ) == 0
+
+'''
+Returns the number of refinements that could resolve an open condition,
+without building them: the number of new step schemas that add the
+predicate with arguments of the right types, plus the number of add
+list entries of existing steps whose constants don't clash with it and
+whose arguments have types in common with its own, as refine() requires.
+Counting stops once it reaches "limit".
+'''
+def count_open_refinements( plan , cond , limit ):
+    pred = cond[ 0 ]
+    tracker = Predicate.tracker
+    isVariable = tracker.isVariable
+    ground = tracker.groundEnd
+    predTypes = [ plan.type_of( arg , tracker ) for arg in pred.args ]
+    count = 0
+    for slotTypes in AchieverTypes.get( pred.type_t , () ):
+        for j in range( len( predTypes ) ):
+            if not ( predTypes[ j ] & slotTypes[ j ] ):
+                break
+        else:
+            count += 1
+    for i in range( len( plan.steps ) ):
+        if ( count >= limit ):
+            break
+        if ( i == cond[ 1 ] ):
+            continue
+        for added in plan.steps[ i ].candidate_args( pred , ground ):
+            for j in range( len( pred.args ) ):
+                if ( added[ j ] == pred.args[ j ] ):
+                    continue
+                if ( not isVariable( added[ j ] ) and not isVariable( pred.args[ j ] ) ):
+                    break
+                if not ( plan.type_of( added[ j ] , tracker ) & predTypes[ j ] ):
+                    break
+            else:
+                count += 1
+    return count
+
+'''
+Returns the number of ways a threat can be resolved (0, 1 or 2),
+leaving out orderings that would create a cycle
+'''
+def count_threat_refinements( plan , threat ):
+    count = 0
+    if ( not plan.precedes( threat.threatened.causalStep , threat.actionId ) ):
+        count += 1 ## the threat can come before the causal step
+    if ( not plan.precedes( threat.actionId , threat.threatened.recipientStep ) ):
+        count += 1 ## the threat can come after the recipient step
+    return count
+
+'''
+Returns every flaw of a plan: its threats, then its open conditions
+'''
+def list_flaws( plan ):
+    return [ ( THREAT , threat ) for threat in plan.threats ] + \
+           [ ( OPEN , i ) for i in range( len( plan.open_conditions ) ) ]
+
+'''
+The original strategy: resolve the most recent threat first,
+and otherwise the oldest open condition
+'''
+def select_default( plan ):
+    if ( plan.has_threats() ):
+        return ( THREAT , plan.last_threat() )
+    return ( OPEN , 0 )
+
+'''
+Least cost flaw repair: resolve the flaw with the fewest refinements,
+preferring threats, and older open conditions, on ties
+'''
+def select_lcfr( plan ):
+    best = None
+    bestCount = None
+    for threat in reversed( plan.threats ):
+        count = count_threat_refinements( plan , threat )
+        if ( bestCount is None or count < bestCount ):
+            best , bestCount = ( THREAT , threat ) , count
+            if ( count == 0 ):
+                return best
+    for i in range( len( plan.open_conditions ) ):
+        limit = bestCount if bestCount is not None else INFINITE_REFINEMENTS
+        count = count_open_refinements( plan , plan.open_conditions[ i ] , limit )
+        if ( bestCount is None or count < bestCount ):
+            best , bestCount = ( OPEN , i ) , count
+            if ( count == 0 ):
+                return best
+    return best
+
+'''
+ZLIFO: resolve threats first, then any open condition that has
+no refinements (a dead end) or exactly one (a forced choice), and
+otherwise the most recently added open condition
+'''
+def select_zlifo( plan ):
+    if ( plan.has_threats() ):
+        return ( THREAT , plan.last_threat() )
+    forced = None
+    for i in range( len( plan.open_conditions ) - 1 , -1 , -1 ):
+        count = count_open_refinements( plan , plan.open_conditions[ i ] , 2 )
+        if ( count == 0 ):
+            return ( OPEN , i )
+        if ( count == 1 and forced is None ):
+            forced = ( OPEN , i )
+    if ( forced is not None ):
+        return forced
+    return ( OPEN , len( plan.open_conditions ) - 1 )
+
+'''
+Static predicates first: resolve threats first, then open conditions
+that only the start step can supply, and otherwise the oldest
+open condition
+'''
+def select_static_first( plan ):
+    if ( plan.has_threats() ):
+        return ( THREAT , plan.last_threat() )
+    for i in range( len( plan.open_conditions ) ):
+        if ( is_static( plan.open_conditions[ i ][ 0 ] ) ):
+            return ( OPEN , i )
+    return ( OPEN , 0 )
+
+## All flaw selection strategies by name
+FlawStrategies = {
+    "default" : select_default,
+    "lcfr" : select_lcfr,
+    "zlifo" : select_zlifo,
+    "static" : select_static_first
+}
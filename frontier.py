@@ -0,0 +1,71 @@
+'''
+frontier.py
+-----------
+Contains the class "Frontier", the priority queue of partial
+plans used by the plan search
+'''
+
+import heapq
+
+## Secondary keys that can be used to break ties between plans of
+## equal cost. Smaller values are taken off the frontier first.
+FrontierKeys = {
+    "open" : lambda plan : len( plan.open_conditions ), ## fewest open conditions first
+    "threats" : lambda plan : len( plan.threats ), ## fewest threats first
+    "steps" : lambda plan : len( plan.steps ), ## fewest steps first
+    "depth" : lambda plan : -plan.depth ## deepest plans first
+}
+
+'''
+Frontier
+--------
+A priority queue of (cost, plan) entries built on heapq. It is only
+ever used from one thread, so unlike Queue.PriorityQueue it takes no
+locks, and every entry carries a monotone insertion counter, so plans
+themselves are never compared: ties on cost are broken by the
+configured secondary keys and then by insertion order, which makes
+the order of expansion deterministic.
+
+keys is a sequence of names from FrontierKeys
+order is "fifo" (oldest first) or "lifo" (newest first) among
+entries that tie on every key
+'''
+class Frontier:
+    
+    def __init__( self , keys = () , order = "lifo" ):
+        if order not in ( "fifo" , "lifo" ):
+            raise ValueError( "Unknown frontier order: " + str( order ) )
+        self.keyFunctions = [ FrontierKeys[ key ] for key in keys ]
+        self.step = 1 if order == "fifo" else -1
+        self.counter = 0
+        self.heap = []
+    
+    ## Returns the values of the configured secondary keys for a plan
+    def key_values( self , plan ):
+        return [ keyFunction( plan ) for keyFunction in self.keyFunctions ]
+    
+    ## Adds a plan to the frontier with the given cost. "keys" are its
+    ## secondary key values, for entries that can't compute them from
+    ## themselves (such as the search's refinement records)
+    def put( self , cost , plan , keys = None ):
+        self.counter += self.step
+        entry = [ cost ]
+        entry.extend( self.key_values( plan ) if keys is None else keys )
+        entry.append( self.counter )
+        entry.append( plan )
+        heapq.heappush( self.heap , entry )
+    
+    ## Removes and returns the cheapest (cost, plan) entry
+    def get( self ):
+        entry = heapq.heappop( self.heap )
+        return ( entry[ 0 ] , entry[ -1 ] )
+    
+    ## Returns the cost of the cheapest entry without removing it
+    def peek_cost( self ):
+        return self.heap[ 0 ][ 0 ]
+    
+    def empty( self ):
+        return len( self.heap ) == 0
+    
+    def __len__( self ):
+        return len( self.heap )
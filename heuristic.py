@@ -0,0 +1,214 @@
+'''
+heuristic.py
+------------
+Contains the heuristics used to estimate how much work the open
+conditions of a partial plan still need.
+
+Besides the classic estimate (one unit per open condition) there
+are three estimates computed from a relaxed planning graph, built
+once per search from the facts added by the start step:
+hadd - the sum of the relaxed costs of the open conditions
+hmax - the largest relaxed cost of any open condition
+ff - the number of actions in a relaxed plan for all open conditions
+'''
+
+import heapq
+
+from configure import *
+from structures import *
+
+INFINITE = float( "inf" )
+
+'''
+RelaxedPlanningGraph
+--------------------
+Grounds the five action schemas over the objects of a problem,
+ignoring delete lists, and computes for every reachable ground atom
+its h_add and h_max cost and the ground action that adds it most
+cheaply. Ground atoms are (predicate type, argument tuple) pairs.
+'''
+class RelaxedPlanningGraph:
+    
+    def __init__( self , start , tracker ):
+        self.tracker = tracker
+        facts = set( [ ( pred.type_t , tuple( pred.args ) ) for pred in start.addList ] )
+        
+        self.actions = self.ground_actions( facts , tracker )
+        self.addCost , self.bestSupporter = self.relaxed_costs( facts , sum )
+        self.maxCost = self.relaxed_costs( facts , max )[ 0 ]
+        
+        ## Reachable atoms of each predicate type, for matching
+        ## open conditions that still contain variables
+        self.atomsByType = {}
+        for atom in self.addCost:
+            self.atomsByType.setdefault( atom[ 0 ] , [] ).append( atom[ 1 ] )
+        self.matchCache = {}
+    
+    '''
+    Returns a list of (action, preconditions, adds) for every ground
+    action whose static preconditions (adjacent, attached, belong)
+    hold in the start state. Preconditions and adds are ground atoms.
+    '''
+    def ground_actions( self , facts , tracker ):
+        robots = range( tracker.locationEnd , tracker.robotEnd )
+        containers = range( tracker.pileEnd , tracker.containerEnd )
+        ground = tracker.containerEnd ## the "G" literal, under every pile
+        
+        adjacent = [ atom[ 1 ] for atom in facts if atom[ 0 ] == Predicates.ADJACENT ]
+        belong = [ atom[ 1 ] for atom in facts if atom[ 0 ] == Predicates.BELONG ]
+        attached = [ atom[ 1 ] for atom in facts if atom[ 0 ] == Predicates.ATTACHED ]
+        
+        actions = []
+        for ( l , m ) in adjacent:
+            for r in robots:
+                actions.append( Action( Actions.MOVE , r , l , m ) )
+        for ( k , l ) in belong:
+            for ( p , pileLoc ) in attached:
+                if ( pileLoc != l ):
+                    continue
+                for c in containers:
+                    for d in containers + [ ground ]:
+                        if ( c != d ):
+                            actions.append( Action( Actions.TAKE , k , l , c , d , p ) )
+                            actions.append( Action( Actions.PUT , k , l , c , d , p ) )
+            for c in containers:
+                for r in robots:
+                    actions.append( Action( Actions.LOAD , k , l , c , r ) )
+                    actions.append( Action( Actions.UNLOAD , k , l , c , r ) )
+        
+        return [ ( action ,
+                   [ ( type_t , template_args( action.args , slots ) ) for ( type_t , slots ) in Schemas[ action.type_t ][ PREREQS ] ] ,
+                   [ ( type_t , template_args( action.args , slots ) ) for ( type_t , slots ) in Schemas[ action.type_t ][ ADDS ] ] )
+                 for action in actions ]
+    
+    '''
+    Generalised Dijkstra over the relaxed problem. An action becomes
+    applicable once all of its preconditions have a final cost, and
+    costs 1 plus the combination ("sum" or "max") of those costs.
+    Returns the cost of every reachable atom and the index of the
+    action that achieves it most cheaply.
+    '''
+    def relaxed_costs( self , facts , combine ):
+        cost = {}
+        supporter = {}
+        waiting = [ len( pre ) for ( action , pre , adds ) in self.actions ]
+        consumers = {}
+        for i in range( len( self.actions ) ):
+            for atom in self.actions[ i ][ 1 ]:
+                consumers.setdefault( atom , [] ).append( i )
+        
+        heap = [ ( 0 , atom , None ) for atom in facts ]
+        heapq.heapify( heap )
+        while heap:
+            ( atomCost , atom , achiever ) = heapq.heappop( heap )
+            if atom in cost:
+                continue
+            cost[ atom ] = atomCost
+            supporter[ atom ] = achiever
+            for i in consumers.get( atom , () ):
+                waiting[ i ] -= 1
+                if ( waiting[ i ] == 0 ):
+                    actionCost = 1 + combine( [ cost[ pre ] for pre in self.actions[ i ][ 1 ] ] )
+                    for added in self.actions[ i ][ 2 ]:
+                        if added not in cost:
+                            heapq.heappush( heap , ( actionCost , added , i ) )
+        return ( cost , supporter )
+    
+    '''
+    Returns the cheapest reachable ground atom matching a predicate
+    that may contain variables, according to the given cost table,
+    or None if no reachable atom matches.
+    '''
+    def best_match( self , pred , costs ):
+        isVariable = self.tracker.isVariable
+        
+        #variables are named by first occurrence so that the
+        #cache is shared between plans and between variables
+        varNames = {}
+        pattern = []
+        for arg in pred.args:
+            if isVariable( arg ):
+                pattern.append( -1 - varNames.setdefault( arg , len( varNames ) ) )
+            else:
+                pattern.append( arg )
+        key = ( id( costs ) , pred.type_t , tuple( pattern ) )
+        if key in self.matchCache:
+            return self.matchCache[ key ]
+        
+        best = None
+        for args in self.atomsByType.get( pred.type_t , () ):
+            binding = {}
+            for j in range( len( pattern ) ):
+                if ( pattern[ j ] >= 0 ):
+                    if ( args[ j ] != pattern[ j ] ):
+                        break
+                elif ( binding.setdefault( pattern[ j ] , args[ j ] ) != args[ j ] ):
+                    break
+            else:
+                atom = ( pred.type_t , args )
+                if ( best is None or costs[ atom ] < costs[ best ] ):
+                    best = atom
+        self.matchCache[ key ] = best
+        return best
+    
+    ## The h_add cost of a single open condition
+    def add_cost( self , pred ):
+        atom = self.best_match( pred , self.addCost )
+        return INFINITE if atom is None else self.addCost[ atom ]
+    
+    ## The h_max cost of a single open condition
+    def max_cost( self , pred ):
+        atom = self.best_match( pred , self.maxCost )
+        return INFINITE if atom is None else self.maxCost[ atom ]
+    
+    '''
+    Returns the number of distinct ground actions in a relaxed plan
+    that achieves all of the given predicates, found by chaining back
+    through the cheapest supporters
+    '''
+    def relaxed_plan_size( self , preds ):
+        chosen = set()
+        stack = []
+        for pred in preds:
+            atom = self.best_match( pred , self.addCost )
+            if atom is None:
+                return INFINITE
+            stack.append( atom )
+        seen = set()
+        while stack:
+            atom = stack.pop()
+            if atom in seen:
+                continue
+            seen.add( atom )
+            achiever = self.bestSupporter[ atom ]
+            if ( achiever is not None and achiever not in chosen ):
+                chosen.add( achiever )
+                stack.extend( self.actions[ achiever ][ 1 ] )
+        return len( chosen )
+
+'''
+Heuristic constructors by name. Each takes the initial plan and the
+variable tracker and returns a function estimating the remaining cost
+of a plan's open conditions (INFINITE if one of them is unreachable).
+'''
+def classic_heuristic( plan , tracker ):
+    return lambda p : len( p.open_conditions )
+
+def hadd_heuristic( plan , tracker ):
+    graph = RelaxedPlanningGraph( plan.steps[ 0 ] , tracker )
+    return lambda p : sum( [ graph.add_cost( cond[ 0 ] ) for cond in p.open_conditions ] )
+
+def hmax_heuristic( plan , tracker ):
+    graph = RelaxedPlanningGraph( plan.steps[ 0 ] , tracker )
+    return lambda p : max( [ 0 ] + [ graph.max_cost( cond[ 0 ] ) for cond in p.open_conditions ] )
+
+def ff_heuristic( plan , tracker ):
+    graph = RelaxedPlanningGraph( plan.steps[ 0 ] , tracker )
+    return lambda p : graph.relaxed_plan_size( [ cond[ 0 ] for cond in p.open_conditions ] )
+
+Heuristics = {
+    "classic" : classic_heuristic,
+    "hadd" : hadd_heuristic,
+    "hmax" : hmax_heuristic,
+    "ff" : ff_heuristic
+}
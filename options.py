@@ -0,0 +1,60 @@
+'''
+options.py
+----------
+The command line options of the plan search, shared by planner.py
+and batch.py
+'''
+
+from plansearch import *
+
+## Adds the search options to an argparse parser; "modes" are the
+## search modes it may choose from
+def add_search_arguments( parser , modes = SearchModes ):
+    parser.add_argument( "--flaw" , choices = sorted( FlawStrategies.keys() ) , default = "default" ,
+                         help = "flaw selection strategy" )
+    parser.add_argument( "--heuristic" , choices = sorted( Heuristics.keys() ) , default = "classic" ,
+                         help = "estimate of the work left for the open conditions" )
+    parser.add_argument( "--mode" , choices = modes , default = "astar" ,
+                         help = "search algorithm: A*, iterative deepening A*, memory-bounded A* or beam search" )
+    parser.add_argument( "--node-cap" , type = int , default = 10000 ,
+                         help = "the most plans kept in memory by --mode sma" )
+    parser.add_argument( "--beam-width" , type = int , default = 100 ,
+                         help = "the number of plans kept per layer by --mode beam" )
+    if ( "hda" in modes ):
+        parser.add_argument( "--workers" , type = int , default = None ,
+                             help = "the number of processes used by --mode hda (default: one per core)" )
+    parser.add_argument( "--weight" , type = float , default = 1 ,
+                         help = "weight of the open condition estimate (above 1 finds plans faster but longer)" )
+    parser.add_argument( "--dedup" , action = "store_true" ,
+                         help = "detect partial plans reached twice (A* and hda only; keeps every plan seen)" )
+    parser.add_argument( "--no-prune-redundant" , dest = "prune_redundant" , action = "store_false" ,
+                         help = "keep plans that the redundant step check would prune" )
+    parser.add_argument( "--time-limit" , type = float , default = None ,
+                         help = "stop searching after this many seconds" )
+    parser.add_argument( "--node-limit" , type = int , default = MAX_ITERATIONS ,
+                         help = "stop searching after expanding this many plans (default %(default)s)" )
+    parser.add_argument( "--memory-limit" , type = float , default = None ,
+                         help = "stop searching once the process uses this many megabytes" )
+
+## Returns the search_plan keyword arguments given by parsed options
+def search_options( args ):
+    return { "flawStrategy" : args.flaw , "heuristic" : args.heuristic , "mode" : args.mode ,
+             "nodeCap" : args.node_cap , "beamWidth" : args.beam_width ,
+             "workers" : getattr( args , "workers" , None ) , "pruneRedundant" : args.prune_redundant ,
+             "weight" : args.weight , "timeLimit" : args.time_limit , "nodeLimit" : args.node_limit ,
+             "memoryLimit" : args.memory_limit , "dedup" : args.dedup }
+
+## The search_plan options that bound the cost of a search
+BudgetOptions = ( "timeLimit" , "nodeLimit" , "memoryLimit" )
+
+## Returns portfolio configurations (see portfolio.py) that keep to the
+## limits given by parsed options, except where they set their own
+def budgeted_configs( configs , args ):
+    options = search_options( args )
+    budgeted = []
+    for config in configs:
+        config = dict( config )
+        for key in BudgetOptions:
+            config.setdefault( key , options[ key ] )
+        budgeted.append( config )
+    return budgeted
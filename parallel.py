@@ -0,0 +1,222 @@
+'''
+parallel.py
+-----------
+Hash-distributed A* (HDA*): the plan search spread over a pool of
+worker processes.
+
+Every partial plan has an owner, the worker numbered
+plan.signature % workers. Each worker runs A* on its own frontier,
+expanding plans with the same refinement code as planSearch, and sends
+every child it does not own to the child's owner, in batches gathered
+over a few expansions. Since
+equivalent plans have equal signatures, each worker can detect
+duplicates on its own when dedup is on.
+
+A shared counter holds the number of plans that have been generated
+but not yet expanded or discarded, including plans in transit. Workers
+add a plan's children before removing the plan itself, so the counter
+only reaches zero once the search space is exhausted.
+'''
+
+import multiprocessing
+import time
+from Queue import Empty
+
+from plansearch import *
+
+## Children for other workers are buffered and sent once this many
+## plans have been expanded (or sooner if the worker runs out of work)
+FLUSH_INTERVAL = 4
+
+## Seconds an idle worker waits for new plans before checking whether
+## the search is over
+IDLE_WAIT = 0.05
+
+'''
+The body of worker "index". Plans arrive in "inboxes[index]" as lists
+of (cost, plan) pairs. A solution is put on "results", and on exit the
+worker puts ( index , expansions , seconds , status , best ) on "stats",
+where status is the budget limit it stopped at (or None) and best the
+partial plan closest to completion it expanded. "expanded" counts the
+plans all the workers have expanded, against the node limit "nodeLimit".
+A worker that stops at a limit ends the whole search.
+'''
+def hda_worker( index , workers , tracker , selectFlaw , estimate , dedup , inboxes , results , stats , done , pending ,
+                expanded , nodeLimit , budget ):
+    
+    frontier = Frontier()
+    visited = VisitedPlans() if dedup else None
+    outboxes = [ [] for i in range( workers ) ]
+    inbox = inboxes[ index ]
+    expansions = 0
+    started = time.time()
+    best = BestPlan()
+    status = None
+    
+    def send( owner ):
+        if outboxes[ owner ]:
+            inboxes[ owner ].put( outboxes[ owner ] )
+            outboxes[ owner ] = []
+    
+    def receive( batch ):
+        discarded = 0
+        for ( cost , plan ) in batch:
+            if ( visited is None or visited.add( plan ) ):
+                frontier.put( cost , plan )
+            else:
+                discarded += 1
+        if discarded:
+            with pending.get_lock():
+                pending.value -= discarded
+    
+    while ( not done.is_set() ):
+        status = budget.exceeded( expansions )
+        if ( status is not None ):
+            break
+        
+        #take in whatever other workers have sent, waiting a
+        #little if there is nothing else to do
+        try:
+            if ( frontier.empty() ):
+                receive( inbox.get( True , IDLE_WAIT ) )
+            while True:
+                receive( inbox.get_nowait() )
+        except Empty:
+            pass
+        
+        if ( frontier.empty() ):
+            for owner in range( workers ):
+                send( owner )
+            if ( pending.value == 0 ):
+                break
+            continue
+        
+        ( cost , nextPlan ) = frontier.get()
+        if ( nextPlan.is_complete() ):
+            results.put( nextPlan )
+            done.set()
+            break
+        best.offer( nextPlan , cost )
+        
+        #claim one of the expansions the node limit allows
+        with expanded.get_lock():
+            if ( nodeLimit is not None and expanded.value >= nodeLimit ):
+                status = NODE_LIMIT
+                break
+            expanded.value += 1
+        
+        expansions += 1
+        children = successors( nextPlan , selectFlaw , tracker , estimate )
+        with pending.get_lock():
+            pending.value += len( children ) - 1
+        
+        local = []
+        for child in children:
+            owner = child[ 1 ].signature % workers
+            if ( owner == index ):
+                local.append( child )
+            else:
+                outboxes[ owner ].append( child )
+        receive( local )
+        if ( expansions % FLUSH_INTERVAL == 0 ):
+            for owner in range( workers ):
+                send( owner )
+    
+    #the other workers can't make up for a limit, so stop them too
+    if ( status is not None ):
+        done.set()
+    stats.put( ( index , expansions , time.time() - started , status , best.plan ) )
+
+## Removes and returns the solution a worker sent, or None if there is none
+def take_result( results ):
+    try:
+        return results.get_nowait()
+    except Empty:
+        return None
+
+## Empties the given queues, discarding what they hold
+def drain( queues ):
+    for queue in queues:
+        try:
+            while True:
+                queue.get_nowait()
+        except Empty:
+            pass
+
+'''
+Runs HDA* with the given number of worker processes and returns a
+SearchResult. Each worker keeps to the time and memory limits of the
+budget on its own, and the workers share its node limit.
+'''
+def hda_search( p , tracker , selectFlaw , estimate , workers , dedup , budget ):
+    inboxes = [ multiprocessing.Queue() for i in range( workers ) ]
+    results = multiprocessing.Queue()
+    stats = multiprocessing.Queue()
+    done = multiprocessing.Event()
+    pending = multiprocessing.Value( "l" , 1 )
+    expanded = multiprocessing.Value( "l" , 0 )
+    
+    cost = estimate( p )
+    if ( cost == INFINITE_COST ):
+        return search_result( EXHAUSTED , None , 0 , budget )
+    inboxes[ p.signature % workers ].put( [ ( cost , p ) ] )
+    
+    workerBudget = Budget( budget.timeLimit , None , budget.memoryLimit )
+    workerBudget.started = budget.started
+    
+    processes = [ multiprocessing.Process( target = hda_worker ,
+                                           args = ( i , workers , tracker , selectFlaw , estimate , dedup , inboxes , results ,
+                                                    stats , done , pending , expanded , budget.nodeLimit ,
+                                                    workerBudget ) )
+                  for i in range( workers ) ]
+    for process in processes:
+        process.daemon = True
+        process.start()
+    
+    #collect every worker's report, and the solution if one is found.
+    #A worker stops reading its inbox once it has reported, so from then
+    #on its inbox is drained here: a worker still sending it plans could
+    #otherwise never flush its queues, and never exit
+    finalPlan = None
+    total = 0
+    status = EXHAUSTED
+    best = BestPlan()
+    reported = []
+    while ( len( reported ) < workers ):
+        try:
+            record = stats.get( True , IDLE_WAIT )
+        except Empty:
+            record = None
+        if ( finalPlan is None ):
+            finalPlan = take_result( results )
+        drain( [ inboxes[ i ] for i in reported ] )
+        if ( record is None ):
+            #a worker that died without reporting has nothing to report
+            if ( not any( [ process.is_alive() for process in processes ] ) and stats.empty() ):
+                break
+            continue
+        
+        ( index , expansions , seconds , limit , closest ) = record
+        reported.append( index )
+        total += expansions
+        if ( limit is not None ):
+            status = limit
+        if ( closest is not None ):
+            best.offer( closest , estimate( closest ) )
+        print "Worker " + str( index ) + ": " + str( expansions ) + " expansions, " + \
+              str( int( expansions / max( seconds , 1e-6 ) ) ) + " per second"
+    done.set()
+    
+    #a worker only exits once everything it sent has been read
+    for process in processes:
+        while ( process.is_alive() ):
+            if ( finalPlan is None ):
+                finalPlan = take_result( results )
+            drain( inboxes + [ results ] )
+            process.join( IDLE_WAIT )
+    if ( finalPlan is None ):
+        finalPlan = take_result( results )
+    
+    if ( finalPlan is None ):
+        return search_result( status , best.plan , total , budget )
+    return search_result( SOLVED , finalPlan , total , budget )
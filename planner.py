@@ -12,6 +12,7 @@ which you will document in your answer to the first question in the spec
 '''
 
 import sys
+import argparse
 
 from structures import *
 from configure import *
@@ -19,17 +20,23 @@ from variables import *
 from read import *
 from topsort import *
 from plansearch import *
+from portfolio import *
+from options import *
 
 
 ## argv[1] is the input file name
 ## argv[2] is the output file name
-## usage: python main.py <inputfile> <outputfile>
+## usage: python main.py <inputfile> <outputfile> [options]
 
-if len(sys.argv) < 3:
-    print "Not enough arguments\n"
-    sys.exit()
+parser = argparse.ArgumentParser( description = "Find a partially ordered plan for a problem file" )
+parser.add_argument( "inputfile" )
+parser.add_argument( "outputfile" )
+add_search_arguments( parser )
+parser.add_argument( "--portfolio" , metavar = "FILE" ,
+                     help = "race the search configurations listed in a JSON file instead (see portfolio.py)" )
+args = parser.parse_args()
 
-readInputStatus = readfile(sys.argv[1])
+readInputStatus = readfile(args.inputfile)
 if ( not readInputStatus[ 0 ] ):
     print "Could not read file\n"
     sys.exit()
@@ -74,7 +81,20 @@ except:
     print "Could not find a plansearch\n"
     sys.exit()
 '''
-finalPlan = planSearch( initial , tracker )
+if ( args.portfolio ):
+    try:
+        finalPlan = portfolio_search( initial , tracker , budgeted_configs( read_portfolio( args.portfolio ) , args ) )
+    except plan_not_found:
+        sys.exit( 1 )
+else:
+    result = search_plan( initial , tracker , **search_options( args ) )
+    #a search that ran out of plans has no plan worth writing
+    if ( result.status == EXHAUSTED or result.plan is None ):
+        print "FAILED"
+        sys.exit( 1 )
+    if ( not result.solved() ):
+        print "Writing the closest partial plan found (" + str( len( result.flaws ) ) + " flaws left)"
+    finalPlan = result.plan
 
 print "===== FINAL PLAN====="
 printVerbosePlan( finalPlan , tracker )
@@ -84,15 +104,10 @@ print ordering
 
 #write solution to file
 print "Writing solution to file..."
-f = open( sys.argv[ 2 ] , "w" )
-f.write( "actions\n" )
-for i in range( len( finalPlan.steps ) ):
-    f.write( str(i) + " " + finalPlan.steps[ i ].to_output_str() + "\n")
-f.write( "\nconstraints\n" )
-for order in finalPlan.orderings:
-    f.write( str(order[ 0 ]) + " < " + str(order[ 1 ]) + "\n" )
-f.write( "\nlinks\n" )
-for link in finalPlan.links:
-    f.write( str(link.causalStep) + " " + str(link.recipientStep) + " " + link.pred.to_output_str() + "\n" )
+writePlan( finalPlan , args.outputfile )
 print "Done."
 
+#a partial plan written at a limit is not a solution
+if ( not args.portfolio and not result.solved() ):
+    sys.exit( 2 )
+
@@ -3,8 +3,10 @@ from structures import *
 from variables import *
 from topsort import *
 from read import *
-from Queue import PriorityQueue
-import copy
+from frontier import *
+from flaws import *
+from heuristic import *
+from budget import *
 from __builtin__ import True
 
 MAX_ITERATIONS = 300000
@@ -14,6 +16,16 @@ MAX_ITERATIONS = 300000
 #plan cannot possibly be the most efficient
 INFINITE_COST = 1000000
 
+## The redundancy rules: for each type of step, the argument naming the
+## object it acts on, the type of step that would undo it, and the
+## arguments the two steps must agree on for the second to undo the first
+RedundancyRules = {
+    Actions.TAKE : ( 2 , Actions.PUT , ( 2 , 4 ) ), ## take c from pile p, then put it back on p
+    Actions.PUT : ( 2 , Actions.TAKE , ( 2 , 4 ) ), ## put c on pile p, then take it off p again
+    Actions.MOVE : ( 0 , Actions.MOVE , ( 0 , ) ), ## move robot r twice in a row
+    Actions.LOAD : ( 3 , Actions.UNLOAD , ( 3 , 1 ) ) ## load robot r, then unload it at the same location
+}
+
 '''
 Determines if the last action taken was redundant. The 
 redundancy checks we make are as follows:
@@ -21,271 +33,675 @@ redundancy checks we make are as follows:
 * putting down a block then picking it up again
 * moving a robot twice in a row
 * loading then unloading a block
+
+A step is redundant if the next step in "ordering" that mentions
+the object it acts on undoes it. Rather than scanning every later
+step, each step is only compared with the steps that mention its
+object, found through the plan's index of touching steps.
 '''
 def is_redundant( plan , ordering ):
+    position = [ 0 ] * len( ordering )
+    for i in range( len( ordering ) ):
+        position[ ordering[ i ] ] = i
     
-    for i in range( 0 , len( ordering ) ):
-        currIdx = ordering[ i ]
-        currAction = plan.steps[ currIdx ]
+    steps = plan.steps
+    for i in range( len( steps ) ):
+        currAction = steps[ i ]
+        rule = RedundancyRules.get( currAction.type_t )
+        if ( rule is None ):
+            continue
+        keySlot , undoType , matchSlots = rule
         
-        if ( currAction.type_t == Actions.TAKE ):
-            for j in range( i+1 , len(ordering) ):
-                nextAction = plan.steps[ ordering[ j ] ]
-                
-                #picking up a block and then putting it down again
-                #in the same location is redundant
-                if ( nextAction.type_t == Actions.PUT and
-                     nextAction.args[ 2 ] == currAction.args[ 2 ] and
-                     nextAction.args[ 4 ] == currAction.args[ 4 ] ):
-                    return True
-                
-                #if we did something to the block before putting it down
-                #again, then that's not being redundant anymore
-                if ( currAction.args[ 2 ] in nextAction.args ):
-                    break
-        elif ( currAction.type_t == Actions.PUT ):
-            for j in range( i+1 , len(ordering) ):
-                nextAction = plan.steps[ ordering[ j ] ]
-
-                #putting down a block and then picking it up again
-                #is redundant
-                if ( nextAction.type_t == Actions.TAKE and
-                     nextAction.args[ 2 ] == currAction.args[ 2 ] and
-                     nextAction.args[ 4 ] == currAction.args[ 4 ] ):
-                        return True                
-                
-                #if we did something to the block before taking it
-                #again, then that's not being redundant anymore
-                if ( currAction.args[ 2 ] in nextAction.args ):
-                    break
-                
-        elif ( currAction.type_t == Actions.MOVE ):
-            for j in range( i+1 , len(ordering) ):
-                nextAction = plan.steps[ ordering[ j ] ]
-                
-                #moving a robot twice is redundant
-                if ( nextAction.type_t == Actions.MOVE and 
-                     nextAction.args[ 0 ] == currAction.args[ 0 ] ):
-                    return True
-                
-                #if we did something to the robot before moving it
-                #again, then that's not being redundant anymore
-                if ( currAction.args[ 0 ] in nextAction.args ):
+        #find the next step that does something to the same object
+        after = position[ i ]
+        nextIdx = None
+        for j in plan.touching[ currAction.args[ keySlot ] ]:
+            if ( position[ j ] > after and ( nextIdx is None or position[ j ] < position[ nextIdx ] ) ):
+                nextIdx = j
+        if ( nextIdx is None ):
+            continue
+        
+        #if that step undoes this one, this one was redundant
+        nextAction = steps[ nextIdx ]
+        if ( nextAction.type_t == undoType ):
+            for slot in matchSlots:
+                if ( nextAction.args[ slot ] != currAction.args[ slot ] ):
                     break
-                
-        elif ( currAction.type_t == Actions.LOAD ):
-            for j in range( i+1 , len(ordering) ):
-                nextAction = plan.steps[ ordering[ j ] ] 
-                
-                #loading then unloading the same robot at the same
-                #location is redundant
-                if ( nextAction.type_t == Actions.UNLOAD and 
-                     nextAction.args[ 3 ] == currAction.args[ 3 ] and 
-                     nextAction.args[ 1 ] == currAction.args[ 1 ] ):
-                        return True
-                    
-                #if we did something to the robot before unloading it
-                #again, then that's not being redundant anymore
-                if ( currAction.args[ 3 ] in nextAction.args ):
-                    break 
+            else:
+                return True
     return False
     
 '''
 Returns an estimate of the number of steps
 that will be required to complete a partial
 plan. This is the heuristic function.
+"heuristic" estimates the work left for the open
+conditions (see heuristic.py); by default every open
+condition counts as one step. That estimate is multiplied
+by "weight", and plans with redundant steps are pruned
+unless "pruneRedundant" is False.
 '''
-def estimateCost( plan ):
-    topsortResult = topSort( plan.orderings , len( plan.steps ) )
+def estimateCost( plan , heuristic = None , weight = 1 , pruneRedundant = True ):
     
     #if the ordering is inconsistent, this plan
-    #should not be added
-    if ( topsortResult[ 1 ] == False ):
+    #should not be added. Cycles are detected by the plan's
+    #transitive closure as soon as the ordering is enforced.
+    if ( not plan.consistent ):
         return INFINITE_COST
     
     #check for redundant actions
-    ordering = topsortResult[ 0 ]
-    if ( is_redundant( plan , ordering ) ):
+    if ( pruneRedundant and is_redundant( plan , plan.linearize() ) ):
         return INFINITE_COST
     
-    return len( plan.steps ) + len( plan.threats ) + len( plan.open_conditions )
+    if ( heuristic is None ):
+        remaining = len( plan.open_conditions )
+    else:
+        remaining = heuristic( plan )
+        
+        #some open condition can never be achieved
+        if ( remaining == INFINITE ):
+            return INFINITE_COST
+    
+    return len( plan.steps ) + len( plan.threats ) + weight * remaining
+
+'''
+Returns the function a search uses to cost plans: estimateCost with
+the given heuristic and options
+'''
+def cost_function( heuristic = None , weight = 1 , pruneRedundant = True ):
+    return lambda plan : estimateCost( plan , heuristic , weight , pruneRedundant )
+
+'''
+Remembers every plan that has been put on the queue, so that the same
+partial plan reached through a different order of refinements is only
+searched once. Plans are bucketed by their incremental signature and
+canonical keys are only built and compared when signatures collide.
+'''
+class VisitedPlans:
+    
+    def __init__( self ):
+        self.buckets = {}
+        self.duplicates = 0 ## Number of duplicate plans pruned
+    
+    '''
+    Records the plan and returns True, or returns False if an
+    equivalent plan has already been recorded
+    '''
+    def add( self , plan ):
+        bucket = self.buckets.get( plan.signature )
+        if bucket is None:
+            self.buckets[ plan.signature ] = [ plan ]
+            return True
+        
+        key = plan.canonical_key()
+        for other in bucket:
+            if other.canonical_key() == key:
+                self.duplicates += 1
+                return False
+        bucket.append( plan )
+        return True
 
-def insert_plan( pq , plan ):
-    cost = estimateCost( plan )
+def insert_plan( pq , plan , visited = None , estimate = estimateCost ):
+    cost = estimate( plan )
     
     #if the heuristic function decides that this path
     #has no hope because it's performing redundant actions,
     #bad action sequences, etc., we'll just prune it
-    if ( cost != INFINITE_COST ):
-        pq.put( (cost , plan) )
+    if ( cost == INFINITE_COST ):
+        return
+    
+    #the same plan may already have been reached through
+    #a different order of refinements
+    if ( visited is not None and not visited.add( plan ) ):
+        return
+    
+    pq.put( cost , plan )
 
-## ***** Implement Partial Order / SNLP planning here
-## Take an initial partial plan, and a variable tracker,
-## return a complete plan
-## p is a Plan object
-## tracker is a VariableTracker object
-def planSearch(p, tracker):
+## The kinds of refinement that resolve a flaw
+ORDER = 0 ## order a threat before or after a causal link
+LINK = 1 ## link an open condition to an existing step
+NEW_STEP = 2 ## link an open condition to a new step
 
-    #start with empty priority queue
-    pq = PriorityQueue()
-    insert_plan( pq , p )
+'''
+Refinement
+----------
+A lightweight description of a successor of "parent": which flaw it
+resolves, how (kind is ORDER, LINK or NEW_STEP), and the data needed
+to build it:
+ORDER - ( before , after ) step indices
+LINK - ( step index , variable bindings )
+NEW_STEP - ( new action , variable bindings )
+The successor plan itself is only built by materialise().
+'''
+class Refinement:
+    
+    def __init__( self , parent , flaw , kind , data ):
+        self.parent = parent
+        self.flaw = flaw
+        self.kind = kind
+        self.data = data
+
+'''
+Returns the refinements that resolve the given flaw of a plan, without
+building any successor plans
+'''
+def refine( plan , flaw , tracker ):
+    refinements = []
+    
+    #a threat is resolved by ordering it before or after the causal link
+    if ( flaw[ 0 ] == THREAT ):
+        threat = flaw[ 1 ]
+        
+        #enforce T < A, or B < T
+        refinements.append( Refinement( plan , flaw , ORDER , ( threat.actionId , threat.threatened.causalStep ) ) )
+        refinements.append( Refinement( plan , flaw , ORDER , ( threat.threatened.recipientStep , threat.actionId ) ) )
+        return refinements
+    
+    nextPrecond , precondParentIdx = plan.open_conditions[ flaw[ 1 ] ]
+    
+    #go through all previous actions: we're going to see if we can
+    #get it to link and satisfy the precondition
+    for i in range( 0 , len( plan.steps ) ):
+        
+        #but do not let an action satisfy its own precondition
+        #(index 1 stores the parent index and we can't let the
+        #parent satisfy its own precondition)
+        if ( i != precondParentIdx ):
+            
+            #find all sets of variable bindings such that the given action adds 
+            #the open precondition, without binding a variable to an object
+            #of the wrong type
+            for sub in plan.steps[ i ].adds( nextPrecond , tracker ):
+                if ( plan.well_typed( sub , tracker ) ):
+                    refinements.append( Refinement( plan , flaw , LINK , ( i , sub ) ) )
+    
+    #add a new step for every schema that can add the precondition,
+    #binding it through the add list entry that matches
+    for ( schemaType , slot ) in Achievers.get( nextPrecond.type_t , () ):
+        a = fresh_action( schemaType , plan.nextVar )
+        sub = a.adds_at( nextPrecond , slot , tracker )
+        if ( sub is not None and plan.well_typed( sub , tracker , argument_types( a ) ) ):
+            refinements.append( Refinement( plan , flaw , NEW_STEP , ( a , sub ) ) )
+    
+    return refinements
+
+'''
+Returns a cheap estimate of the cost of a refinement's successor, from
+the cost of its parent and the change the refinement makes: a new step
+adds one, and a resolved threat removes one. With the classic heuristic
+the change in open conditions is counted as well, each one weighing
+"openWeight" (zero for the other heuristics).
+'''
+def estimate_refinement( parentCost , refinement , openWeight ):
+    if ( refinement.kind == ORDER ):
+        return parentCost - 1
+    cost = parentCost - openWeight
+    if ( refinement.kind == NEW_STEP ):
+        cost += 1 + openWeight * len( Schemas[ refinement.data[ 0 ].type_t ][ PREREQS ] )
+    return cost
+
+'''
+Returns the change a refinement makes to its parent's value of the
+frontier key "key" (see FrontierKeys): the successor is one refinement
+deeper, an ordering resolves a threat, and a link or a new step closes
+an open condition, the new step opening its own preconditions
+'''
+def refinement_key_delta( key , refinement ):
+    if ( key == "depth" ):
+        return -1
+    if ( refinement.kind == ORDER ):
+        return -1 if key == "threats" else 0
+    newStep = ( refinement.kind == NEW_STEP )
+    if ( key == "open" ):
+        return -1 + ( len( Schemas[ refinement.data[ 0 ].type_t ][ PREREQS ] ) if newStep else 0 )
+    if ( key == "steps" ):
+        return 1 if newStep else 0
+    return 0
+
+'''
+Builds the successor plan described by a refinement, or returns None
+if the refinement turns out to be inconsistent (its ordering would
+create a cycle, or its bindings break a non-codesignation constraint).
+The parent plan is not modified: the successor shares its structure
+copy-on-write.
+'''
+def materialise( refinement , tracker ):
+    childPlan = refinement.parent.copy()
+    childPlan.depth += 1
+    flaw = refinement.flaw
+    
+    if ( refinement.kind == ORDER ):
+        childPlan.remove_threat( flaw[ 1 ] )
+        
+        #enforce the ordering, unless that would create a cycle
+        if ( not childPlan.enforce_ordering( refinement.data[ 0 ] , refinement.data[ 1 ] ) ):
+            return None
+        return childPlan
+    
+    #remove the open precondition that is being satisfied
+    nextPrecond , precondParentIdx = childPlan.remove_open_condition( flaw[ 1 ] )
+    
+    if ( refinement.kind == LINK ):
+        i , sub = refinement.data
+        
+        #add the causal link to the given precondition
+        childPlan.add_link( Link( nextPrecond , i , precondParentIdx ) )
+        
+        #we have to enforce that this action comes before the
+        #the action that gets its precondition satisfied.
+        #if it already has to come after it, drop this child
+        if ( not childPlan.enforce_ordering( i , precondParentIdx ) ):
+            return None
+        
+        #perform all necessary variable bindings on the successor,
+        #unless they would bind two objects that must differ, and drop
+        #the child if its static conditions can no longer be supported
+        if ( not childPlan.bind_variables( sub , tracker ) or not childPlan.forward_check( tracker ) ):
+            return None
+        newLink = childPlan.links[ len(childPlan.links)-1 ]
+
+        #calculate new threats that result from adding this new causal link.
+        #specifically, we look at previous actions and see if any of them
+        #threaten the causal link we just added
+        childPlan.calculate_threats_to_new_link( newLink )
+        return childPlan
+    
+    a , sub = refinement.data
+    
+    #add the potential action to the successor plan
+    newIdx = childPlan.add_step( a )
+    
+    #add the preconditions of of the potential action
+    #to the plan's open preconditions
+    for prereq in a.getPrereqs():
+        childPlan.add_open_condition( prereq , newIdx )
+        
+    #create the new causal link
+    childPlan.add_link( Link( nextPrecond , newIdx , precondParentIdx ) )
+    
+    #enforce that the causal step of the link
+    #comes before the recipient step
+    childPlan.enforce_ordering( newIdx , precondParentIdx )
+
+    #perform all variable bindings in the successor, then forward
+    #check the new step's static preconditions
+    if ( not childPlan.bind_variables( sub , tracker ) or not childPlan.forward_check( tracker ) ):
+        return None
+    newLink = childPlan.links[ len(childPlan.links)-1 ]
+
+    #check if adding this action might threaten any 
+    #causal links already added
+    childPlan.calculate_threats_from_new_step( newIdx )
+     
+    #look for previous actions that might threaten this new
+    #causal link           
+    childPlan.calculate_threats_to_new_link( newLink )
+    return childPlan
+
+'''
+Builds every successor of a plan that survives pruning, for the search
+modes that don't generate successors lazily. Returns a list of
+(cost, plan) pairs.
+'''
+def successors( plan , selectFlaw , tracker , estimate ):
+    children = []
+    for refinement in refine( plan , selectFlaw( plan ) , tracker ):
+        child = materialise( refinement , tracker )
+        if ( child is None ):
+            continue
+        cost = estimate( child )
+        if ( cost != INFINITE_COST ):
+            children.append( ( cost , child ) )
+    return children
 
+def report_success( iterations ):
+    print "Plan found after " + str( iterations ) + " iterations"
+
+'''
+Keeps the partial plan closest to completion that a search has seen:
+the one with the fewest flaws, and of those the cheapest
+'''
+class BestPlan:
+    
+    def __init__( self ):
+        self.plan = None
+        self.key = None
+    
+    def offer( self , plan , cost ):
+        key = ( len( plan.threats ) + len( plan.open_conditions ) , cost )
+        if ( self.key is None or key < self.key ):
+            self.plan = plan
+            self.key = key
+
+'''
+Builds the result of a search that stopped with the given status after
+expanding "iterations" plans. Extra statistics are passed as keywords.
+'''
+def search_result( status , plan , iterations , budget , **stats ):
+    if ( status == SOLVED ):
+        report_success( iterations )
+    else:
+        print "Search stopped: " + status + " after " + str( iterations ) + " iterations"
+    stats[ "iterations" ] = iterations
+    stats[ "seconds" ] = budget.elapsed()
+    stats[ "peakMemory" ] = peak_memory()
+    return SearchResult( status , plan , stats )
+
+'''
+A* search over partial plans.
+Successors are generated lazily: expanding a plan only puts
+Refinement records on the frontier, with a cost estimated from
+the parent, and a record is turned into a plan when it is popped.
+'''
+def astar_search( p , tracker , selectFlaw , estimate , openWeight , dedup , frontierKeys , frontierOrder , budget ):
+
+    #start with empty priority queue
+    pq = Frontier( frontierKeys , frontierOrder )
+    visited = VisitedPlans() if dedup else None
+    insert_plan( pq , p , visited , estimate )
+    best = BestPlan()
+    status = EXHAUSTED
+    
     iterations = 0
     #we'll use A* search
-    while( not pq.empty() and iterations < MAX_ITERATIONS ):
+    while( not pq.empty() ):
+        limit = budget.exceeded( iterations )
+        if ( limit is not None ):
+            status = limit
+            break
         entry = pq.get()
-        nextPlan = entry[ 1 ]
+        
+        #build the plan if this is a refinement record
+        if ( isinstance( entry[ 1 ] , Refinement ) ):
+            nextPlan = materialise( entry[ 1 ] , tracker )
+            if ( nextPlan is None ):
+                continue
+            cost = estimate( nextPlan )
+            if ( cost == INFINITE_COST ):
+                continue
+            if ( visited is not None and not visited.add( nextPlan ) ):
+                continue
+            
+            #if the estimate was too optimistic, put the plan back
+            #with its real cost unless it would still be next
+            if ( cost > entry[ 0 ] and not pq.empty() and cost > pq.peek_cost() ):
+                pq.put( cost , nextPlan )
+                continue
+        else:
+            nextPlan = entry[ 1 ]
+            cost = entry[ 0 ]
         
         #printVerbosePlan( nextPlan , tracker )
-                
-        #if the ordering isn't consistent, clearly this plan won't work
-        #NOTE: this was moved to the heuristic function. If a plan is inconsistent,
-        #it receives cost of INFINITY and is never added to the queue
-        #if ( not isOrderConsistent( nextPlan.orderings , len( nextPlan.steps ) ) ):
-            #continue
         
         #if the plan is complete, then we're done
         if ( nextPlan.is_complete() ):
-            print "Plan found after " + str( iterations ) + " iterations"
-            return nextPlan
+            if ( visited is not None ):
+                print "Pruned " + str( visited.duplicates ) + " duplicate plans"
+            return search_result( SOLVED , nextPlan , iterations , budget ,
+                                  duplicates = visited.duplicates if visited is not None else 0 )
+        best.offer( nextPlan , cost )
         
         iterations += 1
         if ( iterations % 1000 == 0 ):
             print "Iterations: " + str(iterations)
         
-        #otherwise, try resolving open threats
-        if ( nextPlan.has_threats() ):
-            threat = nextPlan.threats[ len(nextPlan.threats)-1 ]
-            del nextPlan.threats[ len(nextPlan.threats)-1 ]
-            
-            #create a copy of the plan with the additional constraint T < A
-            childPlan1 = copy.deepcopy( nextPlan )
-            
-            #enforce T < A
-            childPlan1.enforce_ordering( threat.actionId , threat.threatened.causalStep )
-                
-            insert_plan( pq , childPlan1 )
-            
-            #create a copy of the plan with the additional constraint B < T
-            childPlan2 = copy.deepcopy( nextPlan )
-
-            #enforce B < T
-            childPlan2.enforce_ordering(threat.threatened.recipientStep , threat.actionId)
+        #otherwise, pick a flaw to resolve and queue its refinements,
+        #whose frontier keys are estimated from the parent's like their cost
+        flaw = selectFlaw( nextPlan )
+        parentKeys = pq.key_values( nextPlan )
+        for refinement in refine( nextPlan , flaw , tracker ):
+            keys = [ parentKeys[ i ] + refinement_key_delta( frontierKeys[ i ] , refinement )
+                     for i in range( len( parentKeys ) ) ]
+            pq.put( estimate_refinement( cost , refinement , openWeight ) , refinement , keys )
+    
+    return search_result( status , best.plan , iterations , budget ,
+                          duplicates = visited.duplicates if visited is not None else 0 )
 
-            insert_plan( pq , childPlan2 )
-            
-        #if no threats, then pick a precondition to satisfy
-        else:
-            nextPrecondIdx = 0 #randint( 0 , len(nextPlan.open_conditions)-1 )
-            nextPrecondTuple = nextPlan.open_conditions[ nextPrecondIdx ]
-            nextPrecond = nextPrecondTuple[ 0 ]
-            precondParentIdx = nextPrecondTuple[ 1 ]
+'''
+Iterative deepening A*: depth first searches that only follow plans
+whose estimated cost is within a bound, raising the bound to the
+cheapest plan that was cut off each time. Only the current path and
+its unexplored siblings are kept in memory.
+'''
+def ida_search( p , tracker , selectFlaw , estimate , budget ):
+    bound = estimate( p )
+    best = BestPlan()
+    iterations = 0
+    if ( bound == INFINITE_COST ):
+        return search_result( EXHAUSTED , None , iterations , budget )
+    
+    while True:
+        print "Cost bound: " + str( bound )
+        nextBound = INFINITE_COST
+        stack = [ ( bound , p ) ]
+        while ( stack ):
+            limit = budget.exceeded( iterations )
+            if ( limit is not None ):
+                return search_result( limit , best.plan , iterations , budget )
+            ( cost , nextPlan ) = stack.pop()
+            if ( nextPlan.is_complete() ):
+                return search_result( SOLVED , nextPlan , iterations , budget )
+            best.offer( nextPlan , cost )
             
-            #remove that open precondition from the list
-            del nextPlan.open_conditions[ nextPrecondIdx ]
+            iterations += 1
+            if ( iterations % 1000 == 0 ):
+                print "Iterations: " + str(iterations)
             
-            #go through all previous actions: we're going to see if we can
-            #get it to link and satisfy the precondition
-            for i in range( 0 , len( nextPlan.steps ) ):
-                
-                #but do not let an action satisfy its own precondition
-                #(index 1 stores the parent index and we can't let the
-                #parent satisfy its own precondition)
-                if ( i != precondParentIdx ):
-                    
-                    #find all sets of variable bindings such that the given action adds 
-                    #the open precondition
-                    substitutions = nextPlan.steps[ i ].adds( nextPrecond , tracker )
-                    if ( len( substitutions ) > 0 ):
-                        for sub in substitutions:
-                            
-                            #we need to create a copy of the current action
-                            #to use at the successor - otherwise, this plan will
-                            #get altered on some other iteration of the search
-                            childPlan = copy.deepcopy( nextPlan )
-                            a = childPlan.steps[ i ]
-                        
-                            #add the causal link to the given precondition
-                            newLink = Link( nextPrecond , i , precondParentIdx )
-                            childPlan.links.append( newLink )
-                            
-                            #we have to enforce that this action comes before the
-                            #the action that gets its precondition satisfied
-                            childPlan.enforce_ordering(i, precondParentIdx )
-                        
-                            #perform all necessary variable bindings on the successor
-                            childPlan.bind_variables( sub , tracker )
+            #push the children so that the cheapest is explored first
+            children = successors( nextPlan , selectFlaw , tracker , estimate )
+            children.sort( key = lambda child : child[ 0 ] , reverse = True )
+            for ( cost , child ) in children:
+                if ( cost <= bound ):
+                    stack.append( ( cost , child ) )
+                else:
+                    nextBound = min( nextBound , cost )
+        
+        #nothing was cut off, so there are no plans left to try
+        if ( nextBound == INFINITE_COST ):
+            return search_result( EXHAUSTED , best.plan , iterations , budget )
+        bound = nextBound
+
+'''
+A node of the SMA* search tree.
+"forgotten" is the lowest cost of the children that were dropped to
+save memory, and "children" the number of children still in memory.
+'''
+class SMANode:
+    
+    def __init__( self , plan , cost , parent ):
+        self.plan = plan
+        self.cost = cost
+        self.parent = parent
+        self.forgotten = INFINITE_COST
+        self.children = 0
+        self.inFrontier = False
 
-                            #calculate new threats that result from adding this new causal link.
-                            #specifically, we look at previous actions and see if any of them
-                            #threaten the causal link we just added
-                            childPlan.calculate_threats_to_new_link( newLink )
+'''
+Simplified memory-bounded A* (SMA*): an A* search that keeps at most
+"nodeCap" nodes in memory. When the cap is exceeded, the most expensive
+leaf is dropped and its cost is backed up into its parent, and a
+parent whose children have all been dropped goes back on the frontier
+with that backed-up cost, so that its subtree is regenerated if it
+becomes the cheapest option again.
+'''
+def sma_search( p , tracker , selectFlaw , estimate , nodeCap , budget ):
+    cheapest = Frontier() ## leaves by lowest cost, newest first
+    dearest = Frontier( order = "fifo" ) ## leaves by highest cost, oldest first
+    counter = [ 0 ] ## entries pushed, used to skip stale heap entries
+    
+    def push( node ):
+        node.inFrontier = True
+        counter[ 0 ] += 1
+        node.version = counter[ 0 ]
+        cheapest.put( node.cost , ( node.version , node ) )
+        dearest.put( -node.cost , ( node.version , node ) )
+    
+    def pop( frontier ):
+        while ( not frontier.empty() ):
+            ( version , node ) = frontier.get()[ 1 ]
+            if ( node.inFrontier and node.version == version ):
+                node.inFrontier = False
+                return node
+        return None
+    
+    #remove a node from memory, backing up its cost into its parent,
+    #and return the number of nodes removed
+    def forget( node ):
+        parent = node.parent
+        parent.children -= 1
+        parent.forgotten = min( parent.forgotten , node.cost )
+        if ( parent.children > 0 or parent.inFrontier ):
+            return 1
+        if ( parent.forgotten == INFINITE_COST ):
+            #every child of the parent was a dead end, so it is one too
+            parent.cost = INFINITE_COST
+            if ( parent.parent is not None ):
+                return 1 + forget( parent )
+            return 1
+        parent.cost = parent.forgotten
+        push( parent )
+        return 1
+    
+    best = BestPlan()
+    iterations = 0
+    rootCost = estimate( p )
+    if ( rootCost == INFINITE_COST ):
+        return search_result( EXHAUSTED , None , iterations , budget )
+    root = SMANode( p , rootCost , None )
+    push( root )
+    stored = 1
+    
+    status = EXHAUSTED
+    while True:
+        limit = budget.exceeded( iterations )
+        if ( limit is not None ):
+            status = limit
+            break
+        node = pop( cheapest )
+        if ( node is None ):
+            break
+        if ( node.plan.is_complete() ):
+            return search_result( SOLVED , node.plan , iterations , budget )
+        best.offer( node.plan , node.cost )
+        
+        iterations += 1
+        if ( iterations % 1000 == 0 ):
+            print "Iterations: " + str(iterations)
+        
+        children = successors( node.plan , selectFlaw , tracker , estimate )
+        node.forgotten = INFINITE_COST
+        if ( not children ):
+            #a dead end: drop it, along with any parents left empty
+            if ( node.parent is None ):
+                break
+            node.cost = INFINITE_COST
+            stored -= forget( node )
+            continue
+        
+        for ( cost , child ) in children:
+            push( SMANode( child , cost , node ) )
+        node.children = len( children )
+        stored += len( children )
+        
+        #drop the most expensive leaves until we are within the cap
+        while ( stored > nodeCap ):
+            worst = pop( dearest )
+            if ( worst is None ):
+                break
+            if ( worst.parent is None ):
+                push( worst )
+                break
+            stored -= forget( worst )
+    
+    return search_result( status , best.plan , iterations , budget )
 
-                            #add the successor to the queue
-                            insert_plan( pq , childPlan )
-            
-            #create a list of new potential actions
-            potentialActions = [ Action( Actions.MOVE , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() ) ,
-                                Action( Actions.TAKE , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() ) ,
-                                Action( Actions.PUT , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() ) ,
-                                Action( Actions.LOAD , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() ) ,
-                                Action( Actions.UNLOAD , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() , tracker.getUnassignedVar() )]
+'''
+Beam search: expands every plan in the current layer and keeps only
+the "beamWidth" cheapest of their successors as the next layer.
+Fast and memory bounded, but incomplete.
+'''
+def beam_search( p , tracker , selectFlaw , estimate , beamWidth , budget ):
+    layer = [ ( estimate( p ) , p ) ]
+    best = BestPlan()
+    iterations = 0
+    while ( layer ):
+        candidates = []
+        for ( cost , nextPlan ) in layer:
+            limit = budget.exceeded( iterations )
+            if ( limit is not None ):
+                return search_result( limit , best.plan , iterations , budget )
+            if ( nextPlan.is_complete() ):
+                return search_result( SOLVED , nextPlan , iterations , budget )
+            best.offer( nextPlan , cost )
             
-            #go through every action
-            for a in potentialActions:
-                
-                #check if it adds the precondition we want to satisfy
-                substitutions = a.adds( nextPrecond , tracker )
-                if ( len( substitutions ) > 0 ):
-                    
-                    #if there exist variable bindings that will let us satisfy
-                    #the preconditions
-                    for sub in substitutions:
-                        
-                        #then we'll create a successor plan - but first
-                        #we need to copy the current plan so that we don't
-                        #get entangled references
-                        childPlan = copy.deepcopy( nextPlan )
-                        
-                        #add the potential action to the successor plan
-                        childPlan.steps.append( a )
-                        
-                        #add the preconditions of of the potential action
-                        #to the plan's open preconditions
-                        for prereq in a.getPrereqs():
-                            childPlan.open_conditions.append( (prereq , len(childPlan.steps)-1) )
-                            
-                        #create the new causal link
-                        newLink = Link( nextPrecond , len(childPlan.steps)-1 , precondParentIdx )
-                        childPlan.links.append( newLink )
-                        
-                        #enforce that the causal step of the link
-                        #comes before the recipient step
-                        childPlan.enforce_ordering(len(childPlan.steps)-1 , precondParentIdx)
+            iterations += 1
+            if ( iterations % 1000 == 0 ):
+                print "Iterations: " + str(iterations)
+            candidates.extend( successors( nextPlan , selectFlaw , tracker , estimate ) )
         
-                        #perform all variable bindings in the successor
-                        childPlan.bind_variables( sub , tracker )
+        candidates.sort( key = lambda child : child[ 0 ] )
+        layer = candidates[ : beamWidth ]
+    
+    return search_result( EXHAUSTED , best.plan , iterations , budget )
+
+## The available search modes
+SearchModes = ( "astar" , "ida" , "sma" , "beam" , "hda" )
+
+## Runs a search and returns a SearchResult (see budget.py)
+## p is a Plan object
+## tracker is a VariableTracker object
+## dedup turns duplicate partial plan detection on or off. It is off by
+## default: SNLP refinements split the search space into disjoint parts,
+## so duplicates are rare, and the table keeps every plan it has seen
+## frontierKeys and frontierOrder decide how plans of equal cost are
+## ordered on the frontier (see frontier.py)
+## flawStrategy names the flaw selection strategy (see flaws.py)
+## heuristic names the open condition estimate (see heuristic.py), and
+## weight multiplies it (weights above 1 trade plan length for speed)
+## pruneRedundant turns the redundant step check (is_redundant) on or off
+## mode is one of SearchModes: A* (astar), iterative deepening A* (ida),
+## memory-bounded A* keeping at most nodeCap nodes (sma), or beam search
+## keeping beamWidth plans per layer (beam), or hash-distributed A*
+## over a pool of processes (hda, see parallel.py). The frontier options
+## only apply to A*, and dedup only to A* and hda.
+## timeLimit (seconds), nodeLimit (plans expanded) and memoryLimit
+## (megabytes of peak resident set size) bound the search; None is
+## unbounded.
+def search_plan(p, tracker, dedup = False, frontierKeys = (), frontierOrder = "lifo", flawStrategy = "default",
+                heuristic = "classic", mode = "astar", nodeCap = 10000, beamWidth = 100, workers = None,
+                pruneRedundant = True, weight = 1, timeLimit = None, nodeLimit = MAX_ITERATIONS,
+                memoryLimit = None):
+    
+    #the budget starts first, so that building a heuristic's planning
+    #graph counts against the time limit
+    budget = Budget( timeLimit , nodeLimit , memoryLimit )
+    selectFlaw = FlawStrategies[ flawStrategy ]
+    estimate = cost_function( Heuristics[ heuristic ]( p , tracker ) , weight , pruneRedundant )
+    
+    if ( mode == "astar" ):
+        return astar_search( p , tracker , selectFlaw , estimate , weight if heuristic == "classic" else 0 ,
+                             dedup , frontierKeys , frontierOrder , budget )
+    elif ( mode == "ida" ):
+        return ida_search( p , tracker , selectFlaw , estimate , budget )
+    elif ( mode == "sma" ):
+        return sma_search( p , tracker , selectFlaw , estimate , nodeCap , budget )
+    elif ( mode == "beam" ):
+        return beam_search( p , tracker , selectFlaw , estimate , beamWidth , budget )
+    elif ( mode == "hda" ):
+        import multiprocessing
+        from parallel import hda_search
+        return hda_search( p , tracker , selectFlaw , estimate , workers or multiprocessing.cpu_count() , dedup , budget )
+    raise ValueError( "Unknown search mode: " + str( mode ) )
 
-                        #check if adding this action might threaten any 
-                        #causal links already added
-                        for link in childPlan.links:
-                            if ( a.deletes( link.pred ) ):
-                                if ( len(childPlan.steps)-1 != link.causalStep and len(childPlan.steps)-1 != link.recipientStep ):
-                                    newThreat = Threat( link , len(childPlan.steps)-1 )
-                                    if ( not childPlan.is_threat_addressed( newThreat ) ):
-                                        childPlan.threats.append( newThreat )
-                         
-                        #look for previous actions that might threaten this new
-                        #causal link           
-                        childPlan.calculate_threats_to_new_link( newLink )
-                                
-                        #add the successor to the queue
-                        insert_plan( pq , childPlan )
-    
-    if pq.empty():
+## ***** Implement Partial Order / SNLP planning here
+## Take an initial partial plan, and a variable tracker,
+## return a complete plan
+## Takes the same options as search_plan. If the search stops at one
+## of its limits, the partial plan closest to completion is returned
+## instead; if no plan is left to search, plan_not_found is raised.
+def planSearch(p, tracker, **options):
+    result = search_plan( p , tracker , **options )
+    if ( result.status == EXHAUSTED or result.plan is None ):
         print "FAILED"
         raise plan_not_found()
-    else:
-        
-        #return closest approximation that was found
-        return pq.get()[1]
+    return result.plan
@@ -0,0 +1,112 @@
+'''
+portfolio.py
+------------
+A portfolio solver: several planSearch configurations race on the same
+problem, each in its own process. The first complete plan wins and the
+other searches are killed.
+
+A portfolio is a JSON file holding a list of configurations. Each
+configuration is an object of search_plan keyword arguments, plus an
+optional "name" used when reporting the winner, for example:
+
+[
+    { "name" : "zlifo-hadd" , "flawStrategy" : "zlifo" , "heuristic" : "hadd" },
+    { "name" : "weighted" , "heuristic" : "ff" , "weight" : 2 },
+    { "name" : "no-pruning" , "pruneRedundant" : false }
+]
+'''
+
+import inspect
+import json
+import multiprocessing
+from Queue import Empty
+
+from plansearch import *
+
+## Seconds between checks on whether the racing searches are still alive
+POLL_INTERVAL = 0.05
+
+## The keyword arguments a configuration may set
+ConfigOptions = inspect.getargspec( search_plan ).args[ 2 : ]
+
+'''
+Reads a portfolio file and returns its list of configurations.
+Raises ValueError if the file is not a list of configurations, or a
+configuration sets an option search_plan doesn't take.
+'''
+def read_portfolio( filename ):
+    with open( filename ) as f:
+        configs = json.load( f )
+
+    if ( not isinstance( configs , list ) or not configs ):
+        raise ValueError( filename + ": a portfolio must be a non-empty list of configurations" )
+    for i in range( len( configs ) ):
+        config = configs[ i ]
+        if ( not isinstance( config , dict ) ):
+            raise ValueError( filename + ": configuration " + str( i ) + " is not an object" )
+        for key in config:
+            if ( key != "name" and key not in ConfigOptions ):
+                raise ValueError( filename + ": configuration " + str( i ) + " has unknown option " + key )
+
+        #a member can't start processes of its own
+        if ( config.get( "mode" ) == "hda" ):
+            raise ValueError( filename + ": configuration " + str( i ) + " can't use --mode hda in a portfolio" )
+
+        #JSON has no tuples, but the frontier keys are one
+        if ( "frontierKeys" in config ):
+            config[ "frontierKeys" ] = tuple( config[ "frontierKeys" ] )
+    return configs
+
+## The name a configuration is reported under
+def config_name( configs , i ):
+    return str( configs[ i ].get( "name" , i ) )
+
+'''
+The body of portfolio member "index": runs a search with its
+configuration and puts ( index , plan ) on "results", with a plan of
+None if the search did not find a complete plan within its budget
+'''
+def portfolio_worker( index , p , tracker , config , results ):
+    options = dict( config )
+    options.pop( "name" , None )
+    result = search_plan( p , tracker , **options )
+    results.put( ( index , result.plan if result.solved() else None ) )
+
+'''
+Races every configuration on the plan "p" and returns the first
+complete plan found, or raises plan_not_found if every configuration
+fails
+'''
+def portfolio_search( p , tracker , configs ):
+    results = multiprocessing.Queue()
+    processes = [ multiprocessing.Process( target = portfolio_worker ,
+                                           args = ( i , p , tracker , configs[ i ] , results ) )
+                  for i in range( len( configs ) ) ]
+    for process in processes:
+        process.start()
+
+    #wait for a plan, or for every configuration to fail
+    finalPlan = None
+    failed = 0
+    while ( finalPlan is None and failed < len( processes ) ):
+        try:
+            ( index , finalPlan ) = results.get( True , POLL_INTERVAL )
+        except Empty:
+            #a member that died without reporting has failed too
+            if ( not any( [ process.is_alive() for process in processes ] ) and results.empty() ):
+                break
+            continue
+        if ( finalPlan is None ):
+            failed += 1
+            print "Portfolio member " + config_name( configs , index ) + " failed"
+
+    for process in processes:
+        if ( process.is_alive() ):
+            process.terminate()
+        process.join()
+
+    if ( finalPlan is None ):
+        print "FAILED"
+        raise plan_not_found()
+    print "Portfolio member " + config_name( configs , index ) + " found the plan"
+    return finalPlan
@@ -36,12 +36,15 @@ def readfile(filename):
     containers = int(sAr(line)[-1])
 
     tracker = VariableTracker(locations, robots, cranes, piles, containers)
+    Predicate.tracker = tracker
     plan = Plan()
     plan.nextVar = tracker.getFirstVar()
 
     start = Action(Actions.START)
     end = Action(Actions.FINISH)
     goal = False
+    goals = []
+    facts = []
 
     line = infile.readline()
     while line:
@@ -89,15 +92,19 @@ def readfile(filename):
 
         else: pass
 
-        if (goal): plan.open_conditions.append((newPred,1))
-        else: start.addList.append(newPred)
+        if (goal): goals.append(newPred)
+        else: facts.append(newPred)
         
         line = infile.readline()
 
-    plan.steps.append(start)
-    plan.steps.append(end)
+    start.facts = FactStore(facts)
+    plan.add_step(start)
+    plan.add_step(end)
 
-    plan.orderings.append((0,1))
+    for newPred in goals:
+        plan.add_open_condition(newPred, 1)
+
+    plan.enforce_ordering(0,1)
 
     return (True, plan, tracker)
 
@@ -157,13 +164,28 @@ def printPlan(plan, tracker):
         print i, str( act )
 
     print "\nconstraints"
-    for i in range(len(plan.orderings)):
-        o = plan.orderings[i]
+    for o in plan.orderings:
         ## Skip over start / end ordering constraints
         if (o[0] == startStep or o[1] == endStep): continue
         print o[0], " < ", o[1]
 
 
+## Writes a plan to the file "filename" in the output format:
+## its actions, ordering constraints and causal links
+def writePlan(plan, filename):
+    f = open(filename, "w")
+    f.write("actions\n")
+    for i in range(len(plan.steps)):
+        f.write(str(i) + " " + plan.steps[i].to_output_str() + "\n")
+    f.write("\nconstraints\n")
+    for order in plan.orderings:
+        f.write(str(order[0]) + " < " + str(order[1]) + "\n")
+    f.write("\nlinks\n")
+    for link in plan.links:
+        f.write(str(link.causalStep) + " " + str(link.recipientStep) + " " + link.pred.to_output_str() + "\n")
+    f.close()
+
+
 ## A function that prints more information about a plan
 ## Possibly useful for debugging
 def printVerbosePlan(plan, tracker):
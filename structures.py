@@ -7,12 +7,16 @@ Link ## A causal link
 Threat ## A threat to a causal link
 thrtCmp ## A comparator allowing threat objects to be sorted
 Ordering ## An ordering constraint (typedef of (int,int))
+OrderingGraph ## The ordering constraints of a plan, as successor/predecessor sets
 Binding ## A variable binding (typedef of (int,int))
 Action ## An action, with type, arguments, add list, delete list, and others
 Plan ## An object for representing partially ordered plans
 plan_not_found ## an exception class
 '''
 
+import random
+from collections import OrderedDict
+
 from configure import *
 from variables import *
 from matplotlib.pyplot import thetagrids
@@ -20,7 +24,12 @@ from matplotlib.pyplot import thetagrids
 ## An object representing a predicate
 ## Predicates have at least one argument, and at most two
 ## Unused arguments are always -1.
-class Predicate:
+## Predicates are immutable once built: the arguments are a tuple, and
+## there is one per ( type , arguments ) in every step of every plan, so
+## they have slots rather than a __dict__.
+class Predicate( object ):
+
+    __slots__ = ( "type_t" , "args" )
     
     '''
     We use a static variable tracker for all Predicates due to
@@ -33,12 +42,18 @@ class Predicate:
     
     def __init__(self, t, arg1 = -1, arg2 = -1):
         self.type_t = t
-        self.args = []
-        if ( arg1 != -1 ):
-            self.args.append(arg1)
-            
-        if ( arg2 != -1 ) :
-            self.args.append(arg2)
+        if ( arg2 != -1 ):
+            self.args = ( arg1 , arg2 )
+        elif ( arg1 != -1 ):
+            self.args = ( arg1 , )
+        else:
+            self.args = ()
+
+    ## Plans sent between processes are pickled; rebuilding a predicate
+    ## from its constructor arguments is smaller and faster than the
+    ## default pickling of a slotted object
+    def __reduce__(self):
+        return ( Predicate , ( self.type_t , ) + self.args )
 
     def is_equal(self, p):
         return (self.type_t == p.type_t) and (self.args[0] == p.args[0]) and (self.args[1] == p.args[1])
@@ -47,9 +62,15 @@ class Predicate:
     ## variable "former" with "newval"
     ## Implemented for you
     def substitute(self, former, newval):
-        for i in range(len( self.args )):
-            if (self.args[i] == former):
-                self.args[i] = newval
+        self.args = tuple( [ (newval if arg == former else arg) for arg in self.args ] )
+
+    ## Returns a predicate with all instances of variable "former"
+    ## replaced by "newval". Predicates shared between plans are never
+    ## modified in place, so this returns self if nothing changes
+    def substituted(self, former, newval):
+        if former not in self.args:
+            return self
+        return Predicate(self.type_t, *[ (newval if arg == former else arg) for arg in self.args ])
     
     def __str__(self):
         argsStr = "(" + Predicate.tracker.getName( self.args[ 0 ] )
@@ -73,16 +94,19 @@ class Predicate:
     @param y - another list of variables or literals to unify with x
     @param theta - the list of substitutions
     @return - the possible substitutions can make x equivalent to y
+    
+    The substitutions are pairs of names. The search itself uses the
+    integer unifiers (unify_ids) instead.
     '''
     @staticmethod
     def unify( x , y , theta , tracker ):
         #DEBUG
-        if ( type(x) == list ):
+        if ( type(x) in ( list , tuple ) ):
             xStr = str([ (tracker.getName( int(var) ) if type(var) == int else var) for var in x ])
         else:
             xStr = tracker.getName( x ) if type(x) == int else str(x)
             
-        if ( type(y) == list ):
+        if ( type(y) in ( list , tuple ) ):
             yStr = str([ (tracker.getName( int(var) ) if type(var) == int else var) for var in y ])
         else:
             yStr = tracker.getName( y ) if type(y) == int else str(y)   
@@ -104,7 +128,7 @@ class Predicate:
             return Predicate.unify_var( y , x , theta , tracker )
         
         #otherwise, this is a list
-        elif( type(x) == list and type(y) == list ):
+        elif( type(x) in ( list , tuple ) and type(y) in ( list , tuple ) ):
             #if the argument lists are different sizes, it is clearly
             #impossible to unify
             if ( len( x ) != len( y ) ):
@@ -141,6 +165,90 @@ class Predicate:
         theta.append( (varName , xName) )
         return theta  
 
+## Integer unification
+## The search unifies predicate arguments directly as integer ids.
+## A unifier takes two argument lists of the same length and the id of
+## the first variable ("ground", see VariableTracker.groundEnd) and
+## returns the bindings that make the lists equal, as a list of
+## ( variable , value ) pairs of ids, or None if they don't unify.
+## The bindings are meant to be applied in order, the way
+## Plan.bind_variables applies them.
+
+## Unifies arguments lists of length one
+def unify_one( x , y , ground ):
+    a = x[ 0 ]
+    b = y[ 0 ]
+    if ( a == b ):
+        return []
+    if ( a >= ground ):
+        return [ ( a , b ) ]
+    if ( b >= ground ):
+        return [ ( b , a ) ]
+    return None
+
+## Unifies arguments lists of length two
+def unify_two( x , y , ground ):
+    a = x[ 0 ]
+    b = y[ 0 ]
+    if ( a == b ):
+        theta = []
+    elif ( a >= ground ):
+        theta = [ ( a , b ) ]
+    elif ( b >= ground ):
+        theta = [ ( b , a ) ]
+    else:
+        return None
+    
+    #the second arguments may mention the variable just bound
+    c = x[ 1 ]
+    d = y[ 1 ]
+    if theta:
+        former , newval = theta[ 0 ]
+        if ( c == former ):
+            c = newval
+        if ( d == former ):
+            d = newval
+    if ( c == d ):
+        return theta
+    if ( c >= ground ):
+        theta.append( ( c , d ) )
+        return theta
+    if ( d >= ground ):
+        theta.append( ( d , c ) )
+        return theta
+    return None
+
+## Unifies argument lists of any length
+def unify_any( x , y , ground ):
+    theta = []
+    for i in range( len( x ) ):
+        a = x[ i ]
+        b = y[ i ]
+        for former , newval in theta:
+            if ( a == former ):
+                a = newval
+            if ( b == former ):
+                b = newval
+        if ( a == b ):
+            continue
+        if ( a >= ground ):
+            theta.append( ( a , b ) )
+        elif ( b >= ground ):
+            theta.append( ( b , a ) )
+        else:
+            return None
+    return theta
+
+## The unifier for each argument list length. Predicates have one or
+## two arguments, so those get unrolled fast paths.
+Unifiers = { 1 : unify_one , 2 : unify_two }
+
+## Unifies two lists of argument ids (see above)
+def unify_ids( x , y , ground ):
+    if ( len( x ) != len( y ) ):
+        return None
+    return Unifiers.get( len( x ) , unify_any )( x , y , ground )
+
 ## A causal link
 ## Consists of a predicate, a "causal step", and a "recipient step"
 ## "causalStep" is an integer referring to a step in a plan which
@@ -148,12 +256,40 @@ class Predicate:
 ##        of the step "recipientStep"
 ##    In the paper's notation:
 ##    causalStep -----pred-----> recipientStep
-class Link:
+class Link( object ):
+
+    __slots__ = ( "pred" , "causalStep" , "recipientStep" )
 
     def __init__(self, p, cstep, rstep):
         self.pred = p
         self.causalStep = cstep
         self.recipientStep = rstep
+
+    ## Pickled by constructor arguments, like predicates
+    def __reduce__(self):
+        return ( Link , ( self.pred , self.causalStep , self.recipientStep ) )
+
+    ## Returns a link whose predicate has "former" replaced by "newval",
+    ## or self if the predicate does not mention "former"
+    def substituted(self, former, newval):
+        pred = self.pred.substituted( former , newval )
+        if pred is self.pred:
+            return self
+        return Link( pred , self.causalStep , self.recipientStep )
+
+    ## Links are values: two links are equal if they protect the same
+    ## predicate between the same steps
+    def key(self):
+        return ( self.pred.type_t , self.pred.args , self.causalStep , self.recipientStep )
+
+    def __eq__(self, other):
+        return isinstance( other , Link ) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash( self.key() )
         
     def __str__(self):
         return str(self.causalStep) + " -- " + str( self.pred ) + " --> " + str( self.recipientStep )
@@ -162,10 +298,29 @@ class Link:
 ## A threat to a causal link
 ## Represents the fact that the step identified by "actionId"
 ##     deletes the predicate of the causal link "threatened"
-class Threat:
+class Threat( object ):
+
+    __slots__ = ( "threatened" , "actionId" )
+
     def __init__(self, thrt, act):
         self.threatened = thrt
         self.actionId = act
+
+    ## Pickled by constructor arguments, like predicates
+    def __reduce__(self):
+        return ( Threat , ( self.threatened , self.actionId ) )
+
+    ## Threats are values: two threats are equal if the same step
+    ## threatens equal links
+    def __eq__(self, other):
+        return ( isinstance( other , Threat ) and self.actionId == other.actionId and
+                 self.threatened == other.threatened )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash( ( self.actionId , self.threatened.key() ) )
         
     def __str__(self):
         return str( self.actionId ) + " threatens " + str(self.threatened)
@@ -176,9 +331,156 @@ class Threat:
 #typedef pair<int, int> Ordering;
 #typedef pair<int, int> Binding;
 
+## The action schemas as static templates. Each schema is a triple of
+## ( preconditions , add list , delete list ), and each entry is a
+## ( predicate type , argument slots ) pair: the predicate's arguments
+## are the action's arguments at those slots. Actions only store their
+## type and arguments, and their predicates are built from these.
+## The start step adds the initial facts, which are stored with it,
+## and the finish step's preconditions are the goals.
+Schemas = {
+    Actions.START : ( () , () , () ),
+    Actions.FINISH : ( () , () , () ),
+
+    ## move(r, l, m) # move robot r from location l to location m
+    ##     precond: adjacent(l, m), at(r, l), free(m)
+    ##     add: at(r, m), occupied(m), free(l)
+    ##     delete: occupied(l), at(r,l), free(m)
+    Actions.MOVE : ( ( ( Predicates.ADJACENT , ( 1 , 2 ) ) , ( Predicates.AT , ( 0 , 1 ) ) , ( Predicates.FREE , ( 2 , ) ) ) ,
+                     ( ( Predicates.AT , ( 0 , 2 ) ) , ( Predicates.OCCUPIED , ( 2 , ) ) , ( Predicates.FREE , ( 1 , ) ) ) ,
+                     ( ( Predicates.OCCUPIED , ( 1 , ) ) , ( Predicates.AT , ( 0 , 1 ) ) , ( Predicates.FREE , ( 2 , ) ) ) ),
+
+    ## take(k,l,c,d,p) #crane k at location l takes c off of d in pile p
+    ##     precond: belong(k,l), attached(p,l), empty(k), top(c,p), on(c,d)
+    ##     add: holding(k,c), top(d,p)
+    ##     delete: empty(k), in(c,p), top(c,p), on(c,d)
+    Actions.TAKE : ( ( ( Predicates.BELONG , ( 0 , 1 ) ) , ( Predicates.ATTACHED , ( 4 , 1 ) ) , ( Predicates.EMPTY , ( 0 , ) ) ,
+                       ( Predicates.TOP , ( 2 , 4 ) ) , ( Predicates.ON , ( 2 , 3 ) ) ) ,
+                     ( ( Predicates.HOLDING , ( 0 , 2 ) ) , ( Predicates.TOP , ( 3 , 4 ) ) ) ,
+                     ( ( Predicates.EMPTY , ( 0 , ) ) , ( Predicates.IN , ( 2 , 4 ) ) , ( Predicates.TOP , ( 2 , 4 ) ) ,
+                       ( Predicates.ON , ( 2 , 3 ) ) ) ),
+
+    ## put(k,l,c,d,p) # crane k at location l puts c onto d in pile p
+    ##     precond: belong(k,l), attached(p,l), holding(k,c), top(d,p)
+    ##     add: empty(k), in(c,p), top(c,p), on(c,d)
+    ##     delete: holding(k,c), top(d,p)
+    Actions.PUT : ( ( ( Predicates.BELONG , ( 0 , 1 ) ) , ( Predicates.ATTACHED , ( 4 , 1 ) ) , ( Predicates.HOLDING , ( 0 , 2 ) ) ,
+                      ( Predicates.TOP , ( 3 , 4 ) ) ) ,
+                    ( ( Predicates.EMPTY , ( 0 , ) ) , ( Predicates.IN , ( 2 , 4 ) ) , ( Predicates.TOP , ( 2 , 4 ) ) ,
+                      ( Predicates.ON , ( 2 , 3 ) ) ) ,
+                    ( ( Predicates.HOLDING , ( 0 , 2 ) ) , ( Predicates.TOP , ( 3 , 4 ) ) ) ),
+
+    ## load(k, l, c, r) # crane k at location l loads container c onto robot r
+    ##     precond: belong(k,l), holding(k,c), at(r,l), unloaded(r)
+    ##     add: empty(k), loaded(r,c)
+    ##     delete: holding(k,c), unloaded(r)
+    Actions.LOAD : ( ( ( Predicates.BELONG , ( 0 , 1 ) ) , ( Predicates.HOLDING , ( 0 , 2 ) ) , ( Predicates.AT , ( 3 , 1 ) ) ,
+                       ( Predicates.UNLOADED , ( 3 , ) ) ) ,
+                     ( ( Predicates.EMPTY , ( 0 , ) ) , ( Predicates.LOADED , ( 3 , 2 ) ) ) ,
+                     ( ( Predicates.HOLDING , ( 0 , 2 ) ) , ( Predicates.UNLOADED , ( 3 , ) ) ) ),
+
+    ## unload(k,l,c,r) # crane k at location l takes container c from robot r
+    ##     precond: belong(k,l), at(r,l), loaded(r,c), empty(k)
+    ##     add: holding(k,c), unloaded(r)
+    ##     delete: empty(k), loaded(r,c)
+    Actions.UNLOAD : ( ( ( Predicates.BELONG , ( 0 , 1 ) ) , ( Predicates.AT , ( 3 , 1 ) ) , ( Predicates.LOADED , ( 3 , 2 ) ) ,
+                         ( Predicates.EMPTY , ( 0 , ) ) ) ,
+                       ( ( Predicates.HOLDING , ( 0 , 2 ) ) , ( Predicates.UNLOADED , ( 3 , ) ) ) ,
+                       ( ( Predicates.EMPTY , ( 0 , ) ) , ( Predicates.LOADED , ( 3 , 2 ) ) ) )
+}
+
+## Positions of the templates in a schema
+PREREQS = 0
+ADDS = 1
+DELETES = 2
+
+## The predicate types of each schema's delete list, in order
+DeleteTypes = dict( [ ( schemaType , tuple( [ entry[ 0 ] for entry in Schemas[ schemaType ][ DELETES ] ] ) )
+                      for schemaType in Schemas ] )
+
+## The non-codesignation constraints of the schemas: pairs of argument
+## slots that must never be bound to the same object. A robot can't move
+## to the location it is at, and a container can't be taken off or put
+## onto itself.
+SchemaDistinct = { Actions.MOVE : ( ( 1 , 2 ) , ) , Actions.TAKE : ( ( 2 , 3 ) , ) , Actions.PUT : ( ( 2 , 3 ) , ) }
+
+## Returns the arguments of a template predicate, taken from the
+## action arguments "args"
+def template_args( args , slots ):
+    return tuple( [ args[ slot ] for slot in slots ] )
+
+'''
+The facts of the initial state, which the start step adds, indexed
+for matching conditions that are partly ground. For every predicate
+type and every set of argument positions, the facts are grouped by
+their arguments at those positions, so the facts that could match
+"adjacent l4 ?x" are found with one lookup rather than by scanning
+every fact.
+'''
+class FactStore( object ):
+
+    __slots__ = ( "predicates" , "index" , "pairs" )
+
+    def __init__( self , predicates ):
+        self.predicates = tuple( predicates )
+
+        ## ( type , position bitmask , arguments at those positions )
+        ## -> arguments of the matching facts
+        self.index = {}
+
+        ## For the facts with two arguments: ( type , position , argument
+        ## at that position ) -> bitset of the arguments at the other one
+        self.pairs = {}
+        for pred in self.predicates:
+            n = len( pred.args )
+            for mask in range( 1 << n ):
+                key = ( pred.type_t , mask , tuple( [ pred.args[ i ] for i in range( n ) if mask & ( 1 << i ) ] ) )
+                self.index.setdefault( key , [] ).append( pred.args )
+            if ( n == 2 ):
+                for pos in ( 0 , 1 ):
+                    key = ( pred.type_t , pos , pred.args[ pos ] )
+                    self.pairs[ key ] = self.pairs.get( key , 0 ) | ( 1 << pred.args[ 1 - pos ] )
+
+    ## The index is rebuilt rather than pickled, to keep the plans sent
+    ## between processes small
+    def __reduce__( self ):
+        return ( FactStore , ( self.predicates , ) )
+
+    ## Returns the arguments of every fact of type "type_t"
+    def of_type( self , type_t ):
+        return self.index.get( ( type_t , 0 , () ) , () )
+
+    ## Returns the arguments of the facts that agree with predicate
+    ## "pred" on all of its ground arguments
+    def matching( self , pred , ground ):
+        mask = 0
+        values = []
+        for i in range( len( pred.args ) ):
+            if ( pred.args[ i ] < ground ):
+                mask |= 1 << i
+                values.append( pred.args[ i ] )
+        return self.index.get( ( pred.type_t , mask , tuple( values ) ) , () )
+
+    ## Returns the bitset of the objects that some two-argument fact of
+    ## type "type_t" pairs with one of the objects in bitset "values",
+    ## which are the facts' arguments at position "pos"
+    def supported( self , type_t , pos , values ):
+        pairs = self.pairs
+        result = 0
+        while values:
+            low = values & -values
+            result |= pairs.get( ( type_t , pos , low.bit_length() - 1 ) , 0 )
+            values ^= low
+        return result
+
 ## An object representing an action
 ## Actions have at least three arguments, and at most five
-class Action:
+## Actions are immutable once built. They only hold their type and
+## arguments: their preconditions and effects come from the schema
+## templates, so binding a variable only builds a new argument tuple.
+class Action( object ):
+
+    __slots__ = ( "type_t" , "args" , "facts" )
     
     '''
     Action::adds
@@ -216,224 +518,116 @@ class Action:
         we add the pair (29,15) to our binding list, 
         which can be read as "replace 29 with 15"
         '''
-        for pred in self.addList:
-            if ( pred.type_t == p.type_t ):
-                possibleBindings = Predicate.unify( pred.args , p.args , [] , tracker )
-                if ( possibleBindings != None ):
-                    returnList.append( possibleBindings )
+        ground = tracker.groundEnd
+        unify = Unifiers[ len( p.args ) ]
+        for args in self.candidate_args( p , ground ):
+            possibleBindings = unify( args , p.args , ground )
+            if ( possibleBindings != None ):
+                returnList.append( possibleBindings )
 
         ## ****
 
         return returnList
 
+    ## Returns the bindings that make entry "slot" of the add list equal
+    ## to predicate p, or None if they don't unify
+    def adds_at(self, p, slot, tracker):
+        if ( self.facts is not None ):
+            args = self.facts.predicates[ slot ].args
+        else:
+            args = template_args( self.args , Schemas[ self.type_t ][ ADDS ][ slot ][ 1 ] )
+        return Unifiers[ len( p.args ) ]( args , p.args , tracker.groundEnd )
+
+    ## Returns the arguments of every predicate of type "type_t" in the
+    ## add list
+    def added_args(self, type_t):
+        if ( self.facts is not None ):
+            return self.facts.of_type( type_t )
+        return [ template_args( self.args , entry[ 1 ] ) for entry in Schemas[ self.type_t ][ ADDS ]
+                 if entry[ 0 ] == type_t ]
+
+    ## Returns the arguments of the predicates in the add list that may
+    ## unify with predicate "pred". For the start step these are looked
+    ## up in its fact store by the ground arguments of "pred".
+    def candidate_args(self, pred, ground):
+        if ( self.facts is not None ):
+            return self.facts.matching( pred , ground )
+        return self.added_args( pred.type_t )
+
+    ## Returns the arguments of entry "slot" of the delete list
+    def deleted_at(self, slot):
+        return template_args( self.args , Schemas[ self.type_t ][ DELETES ][ slot ][ 1 ] )
+
+    ## Returns the predicate types of the delete list, in order
+    def delete_types(self):
+        return DeleteTypes[ self.type_t ]
+
 
     ## ******* The rest are implemented for you ***********
 
     ## Constructor
     def __init__(self, t, arg1 = -1, arg2 = -1, arg3 = -1, arg4 = -1, arg5 = -1):
         
-        self.args = [] ## 5 arguments
         ##type of action
-        self.addList = [] ##List of added predicates
-        self.deleteList = [] ##List of deleted predicates
-        
         self.type_t = t
-        if ( arg1 != -1 ):
-            self.args.append(arg1)
-            
-        if ( arg2 != -1 ):
-            self.args.append(arg2)
-            
-        if ( arg3 != -1 ):
-            self.args.append(arg3)
-            
-        if ( arg4 != -1 ):
-            self.args.append(arg4)
-            
-        if ( arg5 != -1 ):
-            self.args.append(arg5)
-
-        self.fillPredicates()
-
-
-    ## A utility that fills addList and deleteList based on args
-    ## Called in constructor, and again during variable substitution
-    ## Implemented for you.
-    ## This is called either during construction, or during a 
-    ## variable rebinding.
-    ## Clears the old lists and inserts predicates into them based on the
-    ## action arguments
-    ## Does nothing if action is start or finish
-    def fillPredicates(self):
-        self.addList = []
-        self.deleteList = []
-        ##self.prereqList = []
-
-        if self.type_t == Actions.MOVE:
-            '''
-            move(r, l, m) # move robot r from location l to location m
-                precond: adjacent(l, m), at(r, l), free(m)
-                add: at(r, m), occupied(m), free(l)
-                delete: occupied(l), at(r,l), free(m)
-            '''
-            self.addList.append(Predicate(Predicates.AT, self.args[0], self.args[2]))
-            self.addList.append(Predicate(Predicates.OCCUPIED, self.args[2]))
-            self.addList.append(Predicate(Predicates.FREE, self.args[1]))
-
-            self.deleteList.append(Predicate(Predicates.OCCUPIED, self.args[1]))
-            self.deleteList.append(Predicate(Predicates.AT, self.args[0], self.args[1]))
-            self.deleteList.append(Predicate(Predicates.FREE, self.args[2]))
-
-        elif self.type_t == Actions.TAKE:
-            '''
-            take(k,l,c,d,p) #crane k at location l takes c off of d in pile p
-                precond: belong(k,l), attached(p,l), empty(k), top(c,p), on(c,d)
-                add: holding(k,c), top(d,p)
-                delete: empty(k), in(c,p), top(c,p), on(c,d)
-            '''
-
-            self.addList.append(Predicate(Predicates.HOLDING, self.args[0], self.args[2]))
-            self.addList.append(Predicate(Predicates.TOP, self.args[3], self.args[4]))
-
-            self.deleteList.append(Predicate(Predicates.EMPTY, self.args[0]))
-            self.deleteList.append(Predicate(Predicates.IN, self.args[2], self.args[4]))
-            self.deleteList.append(Predicate(Predicates.TOP, self.args[2], self.args[4]))
-            self.deleteList.append(Predicate(Predicates.ON, self.args[2], self.args[3]))
-
-        elif self.type_t == Actions.PUT:
-            '''
-            put(k,l,c,d,p) # crane k at location l puts c onto d in pile p
-                precond: belong(k,l), attached(p,l), holding(k,c), top(d,p)
-                add: empty(k), in(c,p), top(c,p), on(c,d)
-                delete: holding(k,c), top(d,p)
-            '''
-
-            self.addList.append(Predicate(Predicates.EMPTY, self.args[0]))
-            self.addList.append(Predicate(Predicates.IN, self.args[2], self.args[4]))
-            self.addList.append(Predicate(Predicates.TOP, self.args[2], self.args[4]))
-            self.addList.append(Predicate(Predicates.ON, self.args[2], self.args[3]))
-
-            self.deleteList.append(Predicate(Predicates.HOLDING, self.args[0], self.args[2]))
-            self.deleteList.append(Predicate(Predicates.TOP, self.args[3], self.args[4]))
-
-        elif self.type_t == Actions.LOAD:
-            '''
-            load(k, l, c, r) # crane k at location l loads container c onto robot r
-                precond: belong(k,l), holding(k,c), at(r,l), unloaded(r)
-                add: empty(k), loaded(r,c)
-                delete: holding(k,c), unloaded(r)
-            '''
-
-            self.addList.append(Predicate(Predicates.EMPTY, self.args[0]))
-            self.addList.append(Predicate(Predicates.LOADED, self.args[3], self.args[2]))
-
-            self.deleteList.append(Predicate(Predicates.HOLDING, self.args[0], self.args[2]))
-            self.deleteList.append(Predicate(Predicates.UNLOADED, self.args[3]))
-
-        elif self.type_t == Actions.UNLOAD:
-            '''
-            unload(k,l,c,r) # crane k at location l takes container c from robot r
-                precond: belong(k,l), at(r,l), loaded(r,c), empty(k)
-                add: holding(k,c), unloaded(r)
-                delete: empty(k), loaded(r,c)
-            '''
-
-            self.addList.append(Predicate(Predicates.HOLDING, self.args[0], self.args[2]))
-            self.addList.append(Predicate(Predicates.UNLOADED, self.args[3]))
-
-            self.deleteList.append(Predicate(Predicates.EMPTY, self.args[0]))
-            self.deleteList.append(Predicate(Predicates.LOADED, self.args[3], self.args[2]))
-
-        else: pass
+        ## up to 5 arguments
+        self.args = tuple( [ arg for arg in ( arg1 , arg2 , arg3 , arg4 , arg5 ) if arg != -1 ] )
+        ## the initial facts, as a FactStore, if this is the start step
+        self.facts = None
+
+    ## Pickled by constructor arguments, like predicates
+    def __reduce__(self):
+        if ( self.facts is None ):
+            return ( Action , ( self.type_t , ) + self.args )
+        return ( Action , ( self.type_t , ) + self.args , ( None , { "facts" : self.facts } ) )
+
+    ## Returns the predicates built from the given templates
+    def instantiate(self, templates):
+        return [ Predicate( type_t , *template_args( self.args , slots ) ) for ( type_t , slots ) in templates ]
+
+    ## The add list, as a tuple of predicates. Except for the start
+    ## step's facts it is built on every access; the search goes through
+    ## adds, adds_at and added_args instead.
+    @property
+    def addList(self):
+        if ( self.facts is not None ):
+            return self.facts.predicates
+        return tuple( self.instantiate( Schemas[ self.type_t ][ ADDS ] ) )
 
+    ## The delete list, as a tuple of predicates built on every access
+    @property
+    def deleteList(self):
+        return tuple( self.instantiate( Schemas[ self.type_t ][ DELETES ] ) )
 
     ## Perform a substitution, substituting all instances of 
     ## variable "former" with "newval"
     ## Implemented for you
     def substitute(self, former, newval):
-        subst = False
-        for i in range(len( self.args )):
-            if (self.args[i] == former):
-                self.args[i] = newval
-                subst = True
-        if (subst): self.fillPredicates()
+        self.args = tuple( [ (newval if arg == former else arg) for arg in self.args ] )
+
+    ## Returns an action with all instances of variable "former" replaced
+    ## by "newval". Actions shared between plans are never modified in
+    ## place, so this returns self if nothing changes
+    def substituted(self, former, newval):
+        if former not in self.args:
+            return self
+        return Action(self.type_t, *[ (newval if arg == former else arg) for arg in self.args ])
 
     ## Returns a list of predicates consisting of the prerequisites
     ## for this particular action
     def getPrereqs(self):
-        prereqList = []
-        if self.type_t == Actions.MOVE:
-            '''
-            move(r, l, m) # move robot r from location l to location m
-                precond: adjacent(l, m), at(r, l), free(m)
-                add: at(r, m), occupied(m), free(l)
-                delete: occupied(l), at(r,l), free(m)
-            '''
-            prereqList.append(Predicate(Predicates.ADJACENT, self.args[1], self.args[2]))
-            prereqList.append(Predicate(Predicates.AT, self.args[0], self.args[1]))
-            prereqList.append(Predicate(Predicates.FREE, self.args[2]))
-
-        elif self.type_t == Actions.TAKE:
-            '''
-            take(k,l,c,d,p) #crane k at location l takes c off of d in pile p
-                precond: belong(k,l), attached(p,l), empty(k), top(c,p), on(c,d)
-                add: holding(k,c), top(d,p)
-                delete: empty(k), in(c,p), top(c,p), on(c,d)
-            '''
-            prereqList.append(Predicate(Predicates.BELONG, self.args[0], self.args[1]))
-            prereqList.append(Predicate(Predicates.ATTACHED, self.args[4], self.args[1]))
-            prereqList.append(Predicate(Predicates.EMPTY, self.args[0]))
-            prereqList.append(Predicate(Predicates.TOP, self.args[2], self.args[4]))
-            prereqList.append(Predicate(Predicates.ON, self.args[2], self.args[3]))
-
-        elif self.type_t == Actions.PUT:
-            '''
-            put(k,l,c,d,p) # crane k at location l puts c onto d in pile p
-                precond: belong(k,l), attached(p,l), holding(k,c), top(d,p)
-                add: empty(k), in(c,p), top(c,p), on(c,d)
-                delete: holding(k,c), top(d,p)
-            '''
-            prereqList.append(Predicate(Predicates.BELONG, self.args[0], self.args[1]))
-            prereqList.append(Predicate(Predicates.ATTACHED, self.args[4], self.args[1]))
-            prereqList.append(Predicate(Predicates.HOLDING, self.args[0], self.args[2]))
-            prereqList.append(Predicate(Predicates.TOP, self.args[3], self.args[4]))
-
-        elif self.type_t == Actions.LOAD:
-            '''
-            load(k, l, c, r) # crane k at location l loads container c onto robot r
-                precond: belong(k,l), holding(k,c), at(r,l), unloaded(r)
-                add: empty(k), loaded(r,c)
-                delete: holding(k,c), unloaded(r)
-            '''
-            prereqList.append(Predicate(Predicates.BELONG, self.args[0], self.args[1]))
-            prereqList.append(Predicate(Predicates.HOLDING, self.args[0], self.args[2]))
-            prereqList.append(Predicate(Predicates.AT, self.args[3], self.args[1]))
-            prereqList.append(Predicate(Predicates.UNLOADED, self.args[3]))
-
-        elif self.type_t == Actions.UNLOAD:
-            '''
-            unload(k,l,c,r) # crane k at location l takes container c from robot r
-                precond: belong(k,l), at(r,l), loaded(r,c), empty(k)
-                add: holding(k,c), unloaded(r)
-                delete: empty(k), loaded(r,c)
-            '''
-            prereqList.append(Predicate(Predicates.BELONG, self.args[0], self.args[1]))
-            prereqList.append(Predicate(Predicates.AT, self.args[3], self.args[1]))
-            prereqList.append(Predicate(Predicates.LOADED, self.args[3], self.args[2]))
-            prereqList.append(Predicate(Predicates.EMPTY, self.args[0]))
-
-        else: pass
-
-        return prereqList
+        return self.instantiate( Schemas[ self.type_t ][ PREREQS ] )
 
 
     ## Returns true if there is a variable binding in which this action deletes the predicate
     ## Probably should also return the binding itself
     ## Calls the unification algorithm
     def deletes(self, p):
-        for i in range(len(self.deleteList)):
-            if (self.deleteList[ i ].type_t == p.type_t):
-                if (Predicate.unify( self.deleteList[ i ].args , p.args , [] , Predicate.tracker ) != None ):
+        ground = Predicate.tracker.groundEnd
+        unify = Unifiers[ len( p.args ) ]
+        for ( type_t , slots ) in Schemas[ self.type_t ][ DELETES ]:
+            if (type_t == p.type_t):
+                if (unify( template_args( self.args , slots ) , p.args , ground ) != None ):
                     return True
         return False
     
@@ -455,29 +649,195 @@ class Action:
         return rtn
 
 
+## The number of arguments of each action schema
+SchemaArity = { Actions.MOVE : 3 , Actions.TAKE : 5 , Actions.PUT : 5 , Actions.LOAD : 4 , Actions.UNLOAD : 4 }
+
+## Types are bitmasks of categories (see configure.py), so that an
+## argument can allow several categories, and two types are compatible
+## if they have a category in common
+def category_mask( *categories ):
+    return sum( [ 1 << category for category in categories ] )
+
+LOCATION_TYPE = category_mask( Categories.LOCATIONS )
+ROBOT_TYPE = category_mask( Categories.ROBOTS )
+CRANE_TYPE = category_mask( Categories.CRANES )
+PILE_TYPE = category_mask( Categories.PILES )
+CONTAINER_TYPE = category_mask( Categories.CONTAINERS )
+## what a container can be stacked on: another container, or the ground
+SUPPORT_TYPE = category_mask( Categories.CONTAINERS , Categories.GROUND )
+
+## The type of every argument of each schema
+SchemaTypes = {
+    Actions.MOVE : ( ROBOT_TYPE , LOCATION_TYPE , LOCATION_TYPE ) , ## move(r, l, m)
+    Actions.TAKE : ( CRANE_TYPE , LOCATION_TYPE , CONTAINER_TYPE , SUPPORT_TYPE , PILE_TYPE ) , ## take(k,l,c,d,p)
+    Actions.PUT : ( CRANE_TYPE , LOCATION_TYPE , CONTAINER_TYPE , SUPPORT_TYPE , PILE_TYPE ) , ## put(k,l,c,d,p)
+    Actions.LOAD : ( CRANE_TYPE , LOCATION_TYPE , CONTAINER_TYPE , ROBOT_TYPE ) , ## load(k, l, c, r)
+    Actions.UNLOAD : ( CRANE_TYPE , LOCATION_TYPE , CONTAINER_TYPE , ROBOT_TYPE ) ## unload(k,l,c,r)
+}
+
+## Returns the types of the arguments of an action, by argument
+def argument_types( action ):
+    return dict( zip( action.args , SchemaTypes.get( action.type_t , () ) ) )
+
+## Returns the bitset of the constants of the given type
+def type_domain( typeMask , tracker ):
+    ranges = ( ( Categories.LOCATIONS , 0 , tracker.locationEnd ) ,
+               ( Categories.ROBOTS , tracker.locationEnd , tracker.robotEnd ) ,
+               ( Categories.CRANES , tracker.robotEnd , tracker.craneEnd ) ,
+               ( Categories.PILES , tracker.craneEnd , tracker.pileEnd ) ,
+               ( Categories.CONTAINERS , tracker.pileEnd , tracker.containerEnd ) ,
+               ( Categories.GROUND , tracker.containerEnd , tracker.groundEnd ) )
+    domain = 0
+    for ( category , first , end ) in ranges:
+        if ( typeMask & ( 1 << category ) ):
+            domain |= ( 1 << end ) - ( 1 << first )
+    return domain
+
+## The achiever index: maps each predicate type to the ( schema , slot )
+## pairs such that a new step of that schema adds the predicate as entry
+## "slot" of its add list. Types that only the start step can add
+## (adjacent, attached and belong) have no entry.
+Achievers = {}
+for schemaType in sorted( SchemaArity.keys() ):
+    added = Schemas[ schemaType ][ ADDS ]
+    for slot in range( len( added ) ):
+        Achievers.setdefault( added[ slot ][ 0 ] , [] ).append( ( schemaType , slot ) )
+
+## The static predicate types (adjacent, attached and belong): no
+## schema adds them, so only the start step can support them
+StaticPredicates = frozenset( [ type_t for type_t in Predicate2Name if type_t not in Achievers ] )
+
+## Returns a new step of the given schema whose arguments are the fresh
+## variables numbered from "firstVar" on (see Plan.nextVar)
+def fresh_action( schemaType , firstVar ):
+    return Action( schemaType , *range( firstVar , firstVar + SchemaArity[ schemaType ] ) )
+
+
+## Plans are hashed Zobrist-style: every step, link, ordering, threat and
+## open condition contributes a pseudo-random 64-bit code for an abstract
+## description of itself (variables and step numbers left out), and the
+## plan's signature is the sum of those codes, updated as the plan changes.
+## The codes are derived from the feature itself rather than drawn in
+## order of first use, so that separate processes agree on them.
+SIGNATURE_MASK = ( 1 << 64 ) - 1
+zobristCodes = {}
+
+def zobrist( feature ):
+    code = zobristCodes.get( feature )
+    if code is None:
+        code = random.Random( hash( feature ) ).getrandbits( 64 )
+        zobristCodes[ feature ] = code
+    return code
+
+## Returns the arguments with every variable replaced by -1
+def abstract_args( args ):
+    isVariable = Predicate.tracker.isVariable
+    return tuple( [ ( -1 if isVariable( arg ) else arg ) for arg in args ] )
+
+
+## The ordering constraints of a plan, as a directed graph over step
+## indices: for every step, the set of steps it has been ordered before
+## (its successors) and after (its predecessors). The sets are frozen
+## and replaced when an ordering is added, so copying the graph only
+## copies two lists of references. Iterating over the graph gives the
+## orderings as (before, after) pairs.
+class OrderingGraph( object ):
+
+    __slots__ = ( "succ" , "pred" , "count" )
+
+    def __init__(self):
+        self.succ = [] ## successor set of each step
+        self.pred = [] ## predecessor set of each step
+        self.count = 0 ## number of orderings
+
+    ## Adds a step with no orderings
+    def add_step(self):
+        self.succ.append( frozenset() )
+        self.pred.append( frozenset() )
+
+    ## Adds the ordering before < after, and returns False if it
+    ## was already there
+    def add(self, before, after):
+        if after in self.succ[ before ]:
+            return False
+        self.succ[ before ] = self.succ[ before ].union( ( after , ) )
+        self.pred[ after ] = self.pred[ after ].union( ( before , ) )
+        self.count += 1
+        return True
+
+    def successors(self, step):
+        return self.succ[ step ]
+
+    def predecessors(self, step):
+        return self.pred[ step ]
+
+    def copy(self):
+        graph = OrderingGraph()
+        graph.succ = list( self.succ )
+        graph.pred = list( self.pred )
+        graph.count = self.count
+        return graph
+
+    def __contains__(self, ordering):
+        return ordering[ 1 ] in self.succ[ ordering[ 0 ] ]
+
+    def __iter__(self):
+        for before in range( len( self.succ ) ):
+            for after in sorted( self.succ[ before ] ):
+                yield ( before , after )
+
+    def __len__(self):
+        return self.count
+
+
 ## A plan object
 ## We put ordering constraints into an std::set for easy element search
 ## We put threats into a set for easy insertion and deletion
 ## Everything else comes in lists
 ## You may want to modify this data structure, depending on how your algorithm works
 ## Just note that if you do so, you may also have to modify the read function
-class Plan:
-    
-    ##The integer id of the next variable to be allocated
-    ##This is important for creating actions "with fresh variables"
-    nextVar = -1
+##
+## Plans are persistent: copy() returns a child that shares every list
+## with its parent, and a list is only copied the first time either plan
+## modifies it (copy-on-write). The Actions, Predicates, Links and Threats
+## stored in those lists are shared as well, so they must never be
+## modified in place - use substituted() to get a rebound copy instead.
+class Plan( object ):
+
+    ## The names of the list attributes that are shared between copies
+    sharedFields = ( "steps" , "links" , "threats" , "open_conditions" , "orderings" , "reachable" ,
+                     "deleters" , "linksByType" , "touching" , "distinct" , "varTypes" , "domains" ,
+                     "threatsByStep" , "openByVariable" , "linksByVariable" )
+
+    ## The bit of "owned" that stands for each shared field
+    ownedBits = dict( [ ( sharedFields[ i ] , 1 << i ) for i in range( len( sharedFields ) ) ] )
+
+    __slots__ = sharedFields + ( "consistent" , "signature" , "canonicalKey" , "depth" , "owned" , "nextVar" )
 
     def __init__(self):
+        ##The integer id of the next variable to be allocated
+        ##This is important for creating actions "with fresh variables"
+        ##Variables are numbered per plan: every variable in the plan is
+        ##below nextVar, and add_step keeps it that way. Variables only
+        ##have to be fresh within a plan, so the ids stay small and dense
+        ##however long the search runs, and siblings reuse the same ids.
+        self.nextVar = -1
+
         ## Actions are uniquely identified by their index in the steps list
         self.steps = []
         self.links = [] ## Causal links
         
-        #we'll represent threats as ordered triples (T , A , B) where
-        #T is the integer that represents the threat action, A is the
-        #integer that represents the first endpoint of the causal link
-        #and B is the integer that represents the second endpoint of the
-        #causal link
-        self.threats = [] ## All threats to causal links
+        #threats are kept in insertion order, keyed by the Threat itself
+        #(the threatening step and the link), so that adding, finding
+        #and removing a threat takes constant time and the same threat
+        #is never recorded twice
+        self.threats = OrderedDict() ## All threats to causal links
+
+        ## The threats by the steps whose closure rows decide whether an
+        ## ordering resolves them: the threatening step (which can come
+        ## before the causal step) and the recipient step of the link
+        ## (which can come before the threatening step), as tuples
+        self.threatsByStep = {}
     
         ## For open conditions, we use a list of (Predicate, int)
         ## because we need to store the "parent" action of each open condition,
@@ -485,53 +845,587 @@ class Plan:
         ## Our solution is to simply pair predicates with integer identifiers
         self.open_conditions = []
     
-        self.orderings = [] ## All ordering constraints
+        self.orderings = OrderingGraph() ## All ordering constraints
+
+        ## The transitive closure of the orderings, one bitset per step:
+        ## bit j of reachable[i] is set if step i must come before step j
+        self.reachable = []
+
+        ## Indexes for finding threats, by predicate type: the ( step index ,
+        ## delete list slot ) pairs of the steps that delete a predicate of
+        ## that type, and the indices of the causal links that protect one.
+        ## The types of a step's effects and of a link's predicate never
+        ## change when variables are bound, so neither needs rebuilding.
+        self.deleters = {}
+        self.linksByType = {}
+
+        ## The steps that mention each object (constant or variable) among
+        ## their arguments, as a tuple of step indices in the order they
+        ## were added. Kept up to date as variables are bound.
+        self.touching = {}
+
+        ## The positions of the open conditions, and of the causal links,
+        ## that mention each variable, as tuples, so that binding a
+        ## variable only rebuilds the entries that mention it
+        self.openByVariable = {}
+        self.linksByVariable = {}
+
+        ## The non-codesignation constraints: the objects (constants or
+        ## variables) that each variable must never be bound to, as a
+        ## frozenset. Kept up to date as variables are bound.
+        self.distinct = {}
+
+        ## The type of every variable (see SchemaTypes), narrowed as
+        ## variables are bound to each other
+        self.varTypes = {}
+
+        ## The candidate values of the variables of the static open
+        ## conditions, as bitsets of constants, narrowed by forward_check.
+        ## A variable without an entry can be any constant of its type.
+        self.domains = {}
+
+        ## Whether the orderings are free of cycles
+        self.consistent = True
+
+        ## Incrementally maintained Zobrist hash of the plan, and its exact
+        ## canonical form (computed on demand, see canonical_key)
+        self.signature = 0
+        self.canonicalKey = None
+
+        ## The number of refinements that led to this plan
+        self.depth = 0
+
+        ## The shared fields that this plan is allowed to modify in place,
+        ## as a bitmask of ownedBits
+        self.owned = ( 1 << len( Plan.sharedFields ) ) - 1
+
+    '''
+    Returns a child plan that shares all of its structure with this
+    plan. Neither plan owns the shared lists anymore, so whichever
+    modifies a list first pays for copying it.
+    '''
+    def copy( self ):
+        child = Plan.__new__( Plan )
+        for field in Plan.__slots__:
+            setattr( child , field , getattr( self , field ) )
+        child.owned = 0
+        child.canonicalKey = None
+        self.owned = 0
+        return child
+
+    '''
+    Returns the named list (or index, or ordering graph), copying it first
+    if it is still shared with another plan. The indexes and the graph hold
+    immutable values, which are replaced rather than modified, so a
+    shallow copy is enough.
+    '''
+    def mutable( self , field ):
+        bit = Plan.ownedBits[ field ]
+        if not ( self.owned & bit ):
+            value = getattr( self , field )
+            setattr( self , field , list( value ) if isinstance( value , list ) else value.copy() )
+            self.owned |= bit
+        return getattr( self , field )
+
+    '''
+    Adds a step to the plan and returns its index
+    '''
+    def add_step( self , action ):
+        self.mutable( "steps" ).append( action )
+        self.mutable( "reachable" ).append( 0 )
+        self.mutable( "orderings" ).add_step()
+        self.update_signature( self.step_feature( action ) , 1 )
+        idx = len( self.steps ) - 1
+        if action.args:
+            self.nextVar = max( self.nextVar , max( action.args ) + 1 )
+            touching = self.mutable( "touching" )
+            for arg in set( action.args ):
+                touching[ arg ] = touching.get( arg , () ) + ( idx , )
+        for ( a , b ) in SchemaDistinct.get( action.type_t , () ):
+            self.add_distinct( action.args[ a ] , action.args[ b ] )
+        isVariable = Predicate.tracker.isVariable
+        for ( arg , argType ) in argument_types( action ).items():
+            if isVariable( arg ):
+                varTypes = self.mutable( "varTypes" )
+                varTypes[ arg ] = varTypes.get( arg , argType ) & argType
+        deleteTypes = action.delete_types()
+        if deleteTypes:
+            deleters = self.mutable( "deleters" )
+            for slot in range( len( deleteTypes ) ):
+                type_t = deleteTypes[ slot ]
+                deleters[ type_t ] = deleters.get( type_t , () ) + ( ( idx , slot ) , )
+        return idx
+
+    '''
+    Records that "x" and "y" must never be bound to the same object.
+    Marks the plan inconsistent and returns False if they already are
+    the same object.
+    '''
+    def add_distinct( self , x , y ):
+        if ( x == y ):
+            self.consistent = False
+            return False
+        isVariable = Predicate.tracker.isVariable
+        for ( var , other ) in ( ( x , y ) , ( y , x ) ):
+            if isVariable( var ):
+                distinct = self.mutable( "distinct" )
+                distinct[ var ] = distinct.get( var , frozenset() ) | frozenset( [ other ] )
+        return True
+
+    '''
+    Returns the type of object "v": the category of a constant, or
+    the type of a variable, looked up first in "newTypes" (the types
+    of the arguments of a step that isn't in the plan yet)
+    '''
+    def type_of( self , v , tracker , newTypes = None ):
+        if ( not tracker.isVariable( v ) ):
+            return category_mask( tracker.getCategory( v ) )
+        if ( newTypes is not None and v in newTypes ):
+            return newTypes[ v ]
+        return self.varTypes.get( v , -1 )
+
+    '''
+    Returns False if one of the bindings of a substitution binds a
+    variable to an object of another type
+    '''
+    def well_typed( self , substitution , tracker , newTypes = None ):
+        for former , newval in substitution:
+            if not ( self.type_of( former , tracker , newTypes ) & self.type_of( newval , tracker , newTypes ) ):
+                return False
+        return True
+
+    ## Returns the bitset of the values that object "v" can still take
+    def domain_of( self , v , tracker ):
+        if ( not tracker.isVariable( v ) ):
+            return 1 << v
+        domain = self.domains.get( v )
+        if domain is None:
+            domain = type_domain( self.varTypes.get( v , -1 ) , tracker )
+        return domain
+
+    '''
+    Forward checks the static open conditions against the start step's
+    facts, which are the only ones that can support them: each argument
+    of such a condition is narrowed to the values that a fact pairs with
+    a value of its other argument, until no domain changes, and every
+    variable left with a single value is bound to it. Returns False,
+    and marks the plan inconsistent, if a domain becomes empty.
+    '''
+    def forward_check( self , tracker ):
+        facts = self.steps[ 0 ].facts
+        changed = True
+        while changed:
+            changed = False
+            for ( pred , parent ) in self.open_conditions:
+                if ( pred.type_t not in StaticPredicates ):
+                    continue
+                ( x , y ) = pred.args
+                if not ( tracker.isVariable( x ) or tracker.isVariable( y ) ):
+                    continue
+                oldX = self.domain_of( x , tracker )
+                oldY = self.domain_of( y , tracker )
+                newX = oldX & facts.supported( pred.type_t , 1 , oldY )
+                newY = oldY & facts.supported( pred.type_t , 0 , newX )
+                if not ( newX and newY ):
+                    self.consistent = False
+                    return False
+                for ( v , old , new ) in ( ( x , oldX , newX ) , ( y , oldY , newY ) ):
+                    if ( new != old ):
+                        self.mutable( "domains" )[ v ] = new
+                        changed = True
+
+            #a variable with a single candidate can only take that value
+            singles = sorted( [ ( v , domain.bit_length() - 1 ) for ( v , domain ) in self.domains.items()
+                                if not ( domain & ( domain - 1 ) ) ] )
+            if singles:
+                if not self.bind_variables( singles , tracker ):
+                    return False
+                changed = True
+        return True
+
+    '''
+    Adds a causal link to the plan
+    '''
+    def add_link( self , link ):
+        self.mutable( "links" ).append( link )
+        self.update_signature( self.link_feature( link ) , 1 )
+        linksByType = self.mutable( "linksByType" )
+        linksByType[ link.pred.type_t ] = linksByType.get( link.pred.type_t , () ) + ( len( self.links ) - 1 , )
+        self.index_variables( "linksByVariable" , link.pred.args , len( self.links ) - 1 )
+
+    '''
+    Adds an open condition (Predicate, parent step index) to the plan
+    '''
+    def add_open_condition( self , pred , parentIdx ):
+        cond = ( pred , parentIdx )
+        self.mutable( "open_conditions" ).append( cond )
+        self.update_signature( self.open_condition_feature( cond ) , 1 )
+        self.index_variables( "openByVariable" , pred.args , len( self.open_conditions ) - 1 )
+
+    '''
+    Removes and returns the open condition at the given index
+    '''
+    def remove_open_condition( self , idx ):
+        cond = self.mutable( "open_conditions" ).pop( idx )
+        self.update_signature( self.open_condition_feature( cond ) , -1 )
+        self.unindex_variables( "openByVariable" , cond[ 0 ].args , idx )
+
+        #the conditions after it move down a place (none, when the
+        #newest condition is the one resolved)
+        isVariable = Predicate.tracker.isVariable
+        moved = set( [ var for later in self.open_conditions[ idx : ] for var in later[ 0 ].args if isVariable( var ) ] )
+        if moved:
+            openByVariable = self.mutable( "openByVariable" )
+            for var in moved:
+                openByVariable[ var ] = tuple( [ i - 1 if i > idx else i for i in openByVariable[ var ] ] )
+        return cond
+
+    ## Moves the positions "entries" indexed under variable "former" in
+    ## the index "field" to its new value "newval"
+    def move_entries( self , field , former , newval , entries ):
+        index = self.mutable( field )
+        del index[ former ]
+        if Predicate.tracker.isVariable( newval ):
+            index[ newval ] = tuple( sorted( set( index.get( newval , () ) + entries ) ) )
+
+    ## Records "entry" under each variable among "args" in the index "field"
+    def index_variables( self , field , args , entry ):
+        isVariable = Predicate.tracker.isVariable
+        for var in set( args ):
+            if isVariable( var ):
+                index = self.mutable( field )
+                index[ var ] = index.get( var , () ) + ( entry , )
+
+    ## Removes "entry" from under each variable among "args" in the index "field"
+    def unindex_variables( self , field , args , entry ):
+        isVariable = Predicate.tracker.isVariable
+        for var in set( args ):
+            if isVariable( var ):
+                index = self.mutable( field )
+                remaining = tuple( [ other for other in index[ var ] if other != entry ] )
+                if remaining:
+                    index[ var ] = remaining
+                else:
+                    del index[ var ]
+
+    '''
+    Records a threat to a causal link, unless it is already recorded
+    '''
+    def add_threat( self , threat ):
+        if threat in self.threats:
+            return
+        self.mutable( "threats" )[ threat ] = True
+        self.update_signature( self.threat_feature( threat ) , 1 )
+        threatsByStep = self.mutable( "threatsByStep" )
+        for step in set( ( threat.actionId , threat.threatened.recipientStep ) ):
+            threatsByStep[ step ] = threatsByStep.get( step , () ) + ( threat , )
+
+    '''
+    Removes a recorded threat
+    '''
+    def remove_threat( self , threat ):
+        del self.mutable( "threats" )[ threat ]
+        self.update_signature( self.threat_feature( threat ) , -1 )
+        threatsByStep = self.mutable( "threatsByStep" )
+        for step in set( ( threat.actionId , threat.threatened.recipientStep ) ):
+            remaining = tuple( [ t for t in threatsByStep[ step ] if t != threat ] )
+            if remaining:
+                threatsByStep[ step ] = remaining
+            else:
+                del threatsByStep[ step ]
+
+    '''
+    Returns the most recently recorded threat
+    '''
+    def last_threat( self ):
+        return next( reversed( self.threats ) )
+
+    '''
+    The abstract descriptions of plan elements that are hashed into
+    the signature. They only mention step types rather than step
+    numbers, so that they survive step renumbering, and they leave
+    out variable names, so that they survive variable renaming.
+    '''
+    def step_feature( self , action ):
+        return ( 0 , action.type_t , abstract_args( action.args ) )
+
+    def link_feature( self , link ):
+        return ( 1 , link.pred.type_t , abstract_args( link.pred.args ) ,
+                 self.steps[ link.causalStep ].type_t , self.steps[ link.recipientStep ].type_t )
+
+    def open_condition_feature( self , cond ):
+        return ( 2 , cond[ 0 ].type_t , abstract_args( cond[ 0 ].args ) , self.steps[ cond[ 1 ] ].type_t )
+
+    def ordering_feature( self , ordering ):
+        return ( 3 , self.steps[ ordering[ 0 ] ].type_t , self.steps[ ordering[ 1 ] ].type_t )
+
+    def threat_feature( self , threat ):
+        return ( 4 , self.steps[ threat.actionId ].type_t , threat.threatened.pred.type_t )
+
+    '''
+    Adds (sign = 1) or removes (sign = -1) a feature from the signature
+    '''
+    def update_signature( self , feature , sign ):
+        self.signature = ( self.signature + sign * zobrist( feature ) ) & SIGNATURE_MASK
+
+    '''
+    Returns an exact description of this plan that is the same for two
+    plans that only differ by step numbering and variable naming.
+    Steps are numbered by sorting them on their type and constant
+    arguments, and variables by the order in which they first appear
+    in the sorted steps. Ties between steps are broken by their original
+    numbering, so two equivalent plans can occasionally get different
+    keys, but plans with equal keys are always equivalent.
+    '''
+    def canonical_key( self ):
+        if self.canonicalKey is not None:
+            return self.canonicalKey
+        
+        isVariable = Predicate.tracker.isVariable
+        stepOrder = sorted( range( len( self.steps ) ) ,
+                            key = lambda i : ( self.steps[ i ].type_t , abstract_args( self.steps[ i ].args ) , i ) )
+        stepMap = [ 0 ] * len( self.steps )
+        for newIdx in range( len( stepOrder ) ):
+            stepMap[ stepOrder[ newIdx ] ] = newIdx
+        
+        varMap = {}
+        def rename( args ):
+            renamed = []
+            for arg in args:
+                if isVariable( arg ):
+                    if arg not in varMap:
+                        varMap[ arg ] = -1 - len( varMap )
+                    arg = varMap[ arg ]
+                renamed.append( arg )
+            return tuple( renamed )
+        
+        steps = tuple( [ ( self.steps[ i ].type_t , rename( self.steps[ i ].args ) ) for i in stepOrder ] )
+        links = tuple( sorted( [ ( stepMap[ l.causalStep ] , stepMap[ l.recipientStep ] , l.pred.type_t , rename( l.pred.args ) )
+                                 for l in self.links ] ) )
+        conds = tuple( sorted( [ ( stepMap[ c[ 1 ] ] , c[ 0 ].type_t , rename( c[ 0 ].args ) )
+                                 for c in self.open_conditions ] ) )
+        threats = tuple( sorted( [ ( stepMap[ t.actionId ] , stepMap[ t.threatened.causalStep ] ,
+                                     stepMap[ t.threatened.recipientStep ] , t.threatened.pred.type_t ,
+                                     rename( t.threatened.pred.args ) ) for t in self.threats ] ) )
+        
+        #the closure, rather than the orderings themselves, so that
+        #redundant orderings added along different paths don't matter
+        orderings = tuple( sorted( [ ( stepMap[ i ] , stepMap[ j ] ) for i in range( len( self.steps ) )
+                                     for j in range( len( self.steps ) ) if self.precedes( i , j ) ] ) )
+        
+        self.canonicalKey = ( steps , links , conds , threats , orderings )
+        return self.canonicalKey
     
     '''
     Calculates any threats to a new causal link that
-    was just added to the plan
+    was just added to the plan. Only the steps that delete a
+    predicate of the link's type are considered.
     '''
     def calculate_threats_to_new_link( self , newLink ):
-        for j in range(len(self.steps)):
-            potentialThreat = Threat( newLink , j )
-            if ( potentialThreat not in self.threats ):
-                if ( self.steps[ j ].deletes( newLink.pred ) ):
-                    if ( j != newLink.causalStep and j != newLink.recipientStep ):
-                        if ( not self.is_threat_addressed( potentialThreat ) ):
-                            self.threats.append( potentialThreat )
+        pred = newLink.pred
+        unify = Unifiers[ len( pred.args ) ]
+        ground = Predicate.tracker.groundEnd
+        lastThreat = -1
+        for ( j , slot ) in self.deleters.get( pred.type_t , () ):
+            if ( j == lastThreat or j == newLink.causalStep or j == newLink.recipientStep ):
+                continue
+            if ( unify( self.steps[ j ].deleted_at( slot ) , pred.args , ground ) is not None ):
+                lastThreat = j
+                potentialThreat = Threat( newLink , j )
+                if ( not self.is_threat_addressed( potentialThreat ) ):
+                    self.add_threat( potentialThreat )
     
     '''
-    Applies the given substitution to the variables in this plan
+    Calculates any threats that the step at index "newIdx", which
+    was just added to the plan, poses to the causal links. Only the
+    links whose predicate type the step deletes are considered.
+    '''
+    def calculate_threats_from_new_step( self , newIdx ):
+        newStep = self.steps[ newIdx ]
+        candidates = set()
+        for type_t in newStep.delete_types():
+            candidates.update( self.linksByType.get( type_t , () ) )
+        for i in sorted( candidates ):
+            link = self.links[ i ]
+            if ( newIdx != link.causalStep and newIdx != link.recipientStep and newStep.deletes( link.pred ) ):
+                newThreat = Threat( link , newIdx )
+                if ( not self.is_threat_addressed( newThreat ) ):
+                    self.add_threat( newThreat )
+    
+    '''
+    Applies the given substitution, a list of ( variable , value ) id
+    pairs applied in order, to the variables in this plan.
+    Only the steps, open conditions and links that mention a substituted
+    variable are visited and rebuilt, through the touching, openByVariable
+    and linksByVariable indexes; everything else stays shared with the
+    parent.
+    Returns False, and marks the plan inconsistent, as soon as a binding
+    is ill-typed, leaves a variable without candidate values or breaks a
+    non-codesignation constraint.
     '''
     def bind_variables( self , substitution , tracker ):
-        for entry in substitution:
-            for action in self.steps:
-                action.substitute( tracker.getId(entry[ 0 ]) , tracker.getId(entry[ 1 ]) )
-            for cond in self.open_conditions:
-                cond[ 0 ].substitute( tracker.getId( entry[ 0 ] ) , tracker.getId( entry[ 1 ] ) )
-            for link in self.links:
-                link.pred.substitute( tracker.getId( entry[ 0 ] ) , tracker.getId( entry[ 1 ] ) )
+        for former , newval in substitution:
+            #the type of "former" narrows the type of its new value
+            formerType = self.varTypes.get( former )
+            if formerType is not None:
+                newType = self.type_of( newval , tracker ) & formerType
+                if not newType:
+                    self.consistent = False
+                    return False
+                varTypes = self.mutable( "varTypes" )
+                del varTypes[ former ]
+                if tracker.isVariable( newval ):
+                    varTypes[ newval ] = newType
+
+            #so does its domain
+            formerDomain = self.domains.get( former )
+            if formerDomain is not None:
+                newDomain = self.domain_of( newval , tracker ) & formerDomain
+                if not newDomain:
+                    self.consistent = False
+                    return False
+                domains = self.mutable( "domains" )
+                del domains[ former ]
+                if tracker.isVariable( newval ):
+                    domains[ newval ] = newDomain
+
+            #the constraints on "former" move to its new value
+            others = self.distinct.get( former )
+            if others is not None:
+                if newval in others:
+                    self.consistent = False
+                    return False
+                distinct = self.mutable( "distinct" )
+                del distinct[ former ]
+                for other in others:
+                    if other in distinct:
+                        distinct[ other ] = distinct[ other ] - frozenset( [ former ] )
+                    self.add_distinct( newval , other )
+
+            #only the steps that mention "former" change
+            changed = self.touching.get( former , () )
+            if changed:
+                touching = self.mutable( "touching" )
+                del touching[ former ]
+                moved = tuple( [ i for i in changed if i not in touching.get( newval , () ) ] )
+                touching[ newval ] = tuple( sorted( touching.get( newval , () ) + moved ) )
+            for i in changed:
+                action = self.steps[ i ].substituted( former , newval )
+                self.update_signature( self.step_feature( self.steps[ i ] ) , -1 )
+                self.update_signature( self.step_feature( action ) , 1 )
+                self.mutable( "steps" )[ i ] = action
+
+            #and so do the open conditions and links that mention it,
+            #which keep their positions
+            changed = self.openByVariable.get( former , () )
+            for i in changed:
+                cond = self.open_conditions[ i ]
+                newCond = ( cond[ 0 ].substituted( former , newval ) , cond[ 1 ] )
+                self.update_signature( self.open_condition_feature( cond ) , -1 )
+                self.update_signature( self.open_condition_feature( newCond ) , 1 )
+                self.mutable( "open_conditions" )[ i ] = newCond
+            if changed:
+                self.move_entries( "openByVariable" , former , newval , changed )
+            rebound = {}
+            recipients = set()
+            changed = self.linksByVariable.get( former , () )
+            for i in changed:
+                old = self.links[ i ]
+                link = old.substituted( former , newval )
+                self.update_signature( self.link_feature( old ) , -1 )
+                self.update_signature( self.link_feature( link ) , 1 )
+                rebound[ id( old ) ] = link
+                recipients.add( link.recipientStep )
+                self.mutable( "links" )[ i ] = link
+            if changed:
+                self.move_entries( "linksByVariable" , former , newval , changed )
+
+            #threats refer to the links they threaten, so point them
+            #at the rebound links (keeping their order). A threat is
+            #indexed under its link's recipient step, so only those need
+            #looking at to find out whether any threat changes
+            if [ t for step in recipients for t in self.threatsByStep.get( step , () ) if id( t.threatened ) in rebound ]:
+                threats = OrderedDict()
+                for threat in self.threats:
+                    if id( threat.threatened ) in rebound:
+                        threat = Threat( rebound[ id( threat.threatened ) ] , threat.actionId )
+                    if threat in threats:
+                        #two threats became the same one
+                        self.update_signature( self.threat_feature( threat ) , -1 )
+                    threats[ threat ] = True
+                self.threats = threats
+                threatsByStep = {}
+                for threat in threats:
+                    for step in set( ( threat.actionId , threat.threatened.recipientStep ) ):
+                        threatsByStep[ step ] = threatsByStep.get( step , () ) + ( threat , )
+                self.threatsByStep = threatsByStep
+                self.owned |= Plan.ownedBits[ "threats" ] | Plan.ownedBits[ "threatsByStep" ]
+        return True
+
     '''
     Adds the given ordering to the list of ordering constraints
     if the given ordering is not already in the list. This also
-    checks for any threats that are resolved
+    checks for any threats that are resolved.
+    
+    The transitive closure is updated incrementally, so an ordering
+    that would create a cycle is detected here: the plan is marked
+    inconsistent and False is returned.
     '''
     def enforce_ordering( self , before , after ):
+        if ( before == after or self.precedes( after , before ) ):
+            self.consistent = False
+            return False
+        
         newOrdering = ( before , after )
         if newOrdering not in self.orderings:
-            self.orderings.append( newOrdering )
+            self.mutable( "orderings" ).add( before , after )
+            self.update_signature( self.ordering_feature( newOrdering ) , 1 )
             
-            #some threats may have been resolved by this ordering, so
-            #remove them
-            self.threats = [ x for x in self.threats if ((x.actionId != before or x.threatened.causalStep != after) and (x.actionId != after or x.threatened.causalStep != before)) ]
+            #everything that comes before "before" (and "before" itself)
+            #now also comes before "after" and everything following it
+            if not self.precedes( before , after ):
+                beforeBit = 1 << before
+                newSuccessors = ( 1 << after ) | self.reachable[ after ]
+                reachable = self.mutable( "reachable" )
+                changed = []
+                for i in range( len( reachable ) ):
+                    if ( ( i == before or reachable[ i ] & beforeBit ) and newSuccessors & ~reachable[ i ] ):
+                        reachable[ i ] |= newSuccessors
+                        changed.append( i )
+                
+                #only the threats of the steps that gained successors
+                #can have been resolved by this ordering, so remove those
+                resolved = []
+                for i in changed:
+                    for threat in self.threatsByStep.get( i , () ):
+                        if ( threat not in resolved and self.is_threat_addressed( threat ) ):
+                            resolved.append( threat )
+                for threat in resolved:
+                    self.remove_threat( threat )
+        return True
+
+    '''
+    Returns if the orderings force step a to come before step b
+    '''
+    def precedes( self , a , b ):
+        return ( self.reachable[ a ] >> b ) & 1 == 1
+
+    '''
+    Returns the steps in an order consistent with the orderings.
+    A step precedes strictly fewer steps than any step before it,
+    so sorting by the size of each closure row is a topological sort.
+    '''
+    def linearize( self ):
+        reachable = self.reachable
+        return sorted( range( len( reachable ) ) , key = lambda i : ( -bin( reachable[ i ] ).count( "1" ) , i ) )
+
     '''
     Determines if there is an ordering that already addresses a potential
-    threat.
+    threat, either directly or transitively.
     '''
     def is_threat_addressed(self , threat):
-        ordering1 = (threat.actionId , threat.threatened.causalStep)
-        ordering2 = (threat.threatened.recipientStep , threat.actionId)
-        return ordering1 in self.orderings or ordering2 in self.orderings
+        return ( self.precedes( threat.actionId , threat.threatened.causalStep ) or
+                 self.precedes( threat.threatened.recipientStep , threat.actionId ) )
     
     '''
     Returns if this plan is a complete plan - i.e. there are no
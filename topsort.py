@@ -6,12 +6,15 @@ which are useful for checking order consistency and
 making partially ordered plans into linear plans (for debugging)
 '''
 
+from collections import deque
+
 
 '''
 Suppose you have a graph with whose vertex count is given by "numVertices",
 with the vertices labeled 0, 1, 2, ..., numVertices-1
 You are given a container "orderings" of ordered pairs of integer (v1, v2),
-representing directed edges v1 --> v2.
+representing directed edges v1 --> v2. This may also be an OrderingGraph
+(see structures.py), whose successor sets are used directly.
 
 The function "topSort" takes orderings and numVertices as inputs,
 and returns a pair of things. The first element of the pair, 
@@ -35,14 +38,19 @@ def topSort(orderings, numVertices):
     incomingEdges = {i : 0 for i in range(numVertices)} ## The number of incoming edges of all vertices
 
     outgoingEdges = {i : [] for i in range(numVertices)} ## List of outgoing edges per vertex
-    S = [] ## Queue of vertices with no incoming edges
+    S = deque() ## Queue of vertices with no incoming edges
     remainingEdges = len(orderings) ## Number of edges remaining in graph
 
     ## For each vertex, create a list of children
     ## Also, keep track of the number of incoming edges for each vertex
-    for i in range(len(orderings)):
-        outgoingEdges[orderings[i][0]].append(orderings[i][1])
-        incomingEdges[orderings[i][1]] += 1 ## Number of incoming edges
+    if hasattr(orderings, "successors"):
+        for i in range(numVertices):
+            outgoingEdges[i] = sorted(orderings.successors(i))
+            incomingEdges[i] = len(orderings.predecessors(i))
+    else:
+        for i in range(len(orderings)):
+            outgoingEdges[orderings[i][0]].append(orderings[i][1])
+            incomingEdges[orderings[i][1]] += 1 ## Number of incoming edges
 
     ## Add all vertices with zero incoming edges to a queue
     for i in range(numVertices):
@@ -54,11 +62,9 @@ def topSort(orderings, numVertices):
     ## remove all edges emanating from it, 
     ## and add to the queue any children who now have no incoming edges
     while len(S) > 0:
-        vertex = S[0]
-        S.pop(0)
+        vertex = S.popleft()
         sorted_t.append(vertex)
-        outgoing = outgoingEdges[vertex][:]
-        for o in outgoing:
+        for o in outgoingEdges[vertex]:
             incomingEdges[o] -= 1 ## Remove an edge
             remainingEdges -= 1
             if (incomingEdges[o] == 0): S.append(o) ## Insert a vertex if no more incoming edges
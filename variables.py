@@ -4,6 +4,8 @@ variables.py
 Implements a class that keeps track of variable names
 '''
 
+from configure import *
+
 '''
 VariableTracker
 ---------------
@@ -103,5 +105,16 @@ class VariableTracker:
     def isLiteral(self, l):
         return (l < self.groundEnd and l >= 0)
 
+    ## Returns the category (see configure.py) of literal l, or None
+    ## if l is a variable
+    def getCategory(self, l):
+        if l < self.locationEnd: return Categories.LOCATIONS
+        elif l < self.robotEnd: return Categories.ROBOTS
+        elif l < self.craneEnd: return Categories.CRANES
+        elif l < self.pileEnd: return Categories.PILES
+        elif l < self.containerEnd: return Categories.CONTAINERS
+        elif l < self.groundEnd: return Categories.GROUND
+        return None
+
 
 